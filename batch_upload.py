@@ -0,0 +1,221 @@
+# batch_upload.py
+# 作用：把大量 URI 分批加入播放清單時，同時送出多個批次（pipeline），而不是一批等一批
+# - 每批都帶明確的 position（start_position + 之前批次的首數），所以最後的順序固定、與逐批送出相同
+# - 相鄰批次間隔 DISPATCH_GAP_SEC 才送出；後面的批次仍比前面的先到時，Spotify 會因 position
+#   超出清單長度而拒絕（400），該批會等前一批完成後用實際位置單獨重送一次
+# - 確認是依批次順序進行，on_ack(累計首數) 只會回報連續成功的前綴，適合寫入 import_journal；
+#   出錯或中斷時 abort() 也會等已送出的批次完成，把其中連續成功的前綴回報出去
+# - 續傳前以 ImportJournal.reconcile(清單長度, MAX_UNACKED) 跳過上次已寫入但沒確認到的批次
+#
+# - rate limiter 的額度由這裡依批次順序取得（limiter 本身不保證先來先得），
+#   post_chunk 的第一次請求不可再取額度
+#
+# 用法（token_helper）：
+#   added = upload_uris(spotify_chunk_poster(playlist_id), uris, start_position=0)
+# 自帶 session / token 的腳本可自行提供 post_chunk(chunk, position)：送出一次請求（額度已取得），
+# 位置被拒絕時（見 is_position_error）丟出 PositionRejected，其他錯誤照原樣丟出。
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, List, Optional, Tuple
+
+import requests
+
+from rate_limiter import get_limiter
+from token_helper import spotify_get, spotify_post
+
+CHUNK_SIZE = 100          # Spotify 一次最多加入 100 首
+UPLOAD_CONCURRENCY = 4    # 同時送出的批次數；1 = 逐批送出
+DISPATCH_GAP_SEC = 0.03   # 相鄰批次至少間隔這麼久才送出，讓請求大致依序抵達，減少 position 被拒絕
+MAX_UNACKED = UPLOAD_CONCURRENCY * CHUNK_SIZE  # 中斷時最多可能有幾首已寫入但還沒確認
+POSITION_ERROR_HINTS = ("position", "index", "out of bounds", "out of range")
+
+PostChunk = Callable[[List[str], int], None]
+
+class PositionRejected(Exception):
+    """post_chunk 回報 position 超出目前清單長度（前面的批次還沒寫入）"""
+
+class _Aborted(Exception):
+    pass
+
+def is_position_error(resp) -> bool:
+    """400 且錯誤訊息提到 position / index（position 超出目前清單長度）；其他 400（例如無效的 URI）不算"""
+    if resp is None or resp.status_code != 400:
+        return False
+    try:
+        err = resp.json().get("error")
+        msg = err.get("message", "") if isinstance(err, dict) else err
+    except (ValueError, AttributeError):
+        msg = resp.text
+    return any(h in str(msg or "").lower() for h in POSITION_ERROR_HINTS)
+
+class PipelinedUploader:
+    """
+    依序接收批次、同時送出；close() 等全部確認後回傳成功加入的首數。
+    每批由自己的 worker 負責：被拒絕時等前一批完成，再用前一批結束的位置重送一次，
+    不會卡住其他已在路上的批次。
+    """
+
+    def __init__(self, post_chunk: PostChunk, start_position: int = 0,
+                 concurrency: int = UPLOAD_CONCURRENCY, on_ack: Optional[Callable[[int], None]] = None,
+                 skip_failed: bool = False):
+        self.post_chunk = post_chunk
+        self.start_position = start_position
+        self.concurrency = max(1, concurrency)
+        self.on_ack = on_ack
+        self.skip_failed = skip_failed  # True：失敗的批次略過並繼續（False 則停止並丟出例外）
+        self.acked = 0        # 已確認、連續寫入的首數
+        self.queued = 0       # 已排入的首數（決定下一批的初始 position）
+        self.stats = {"chunks": 0, "position_retries": 0, "failed": 0}
+        self._limiter = get_limiter()
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="upload")
+        self._inflight: Deque[Tuple[List[str], Future]] = deque()
+        self._lock = threading.Lock()
+        self._aborted = threading.Event()
+        self._broken = False  # 有批次失敗且不略過：之後的批次都不能再確認
+        # 依批次編號記錄：送出時間、是否已送出 / 已完成、寫入後我們這段的結尾（失敗為 None）
+        self._started_at: List[float] = []
+        self._started: List[threading.Event] = []
+        self._done: List[threading.Event] = []
+        self._end_pos: List[Optional[int]] = []
+
+    def add(self, chunk: List[str]):
+        if not chunk:
+            return
+        while len(self._inflight) >= self.concurrency:
+            self._settle_head()
+        with self._lock:
+            k = len(self._done)
+            self._started_at.append(0.0)
+            self._started.append(threading.Event())
+            self._done.append(threading.Event())
+            self._end_pos.append(None)
+        position = self.start_position + self.queued
+        self.queued += len(chunk)
+        self._inflight.append((chunk, self._pool.submit(self._send, k, chunk, position)))
+
+    def _wait(self, ev: threading.Event):
+        while not ev.wait(0.2):
+            if self._aborted.is_set():
+                raise _Aborted()
+
+    def _prefix_end(self, k: int) -> int:
+        """等前面的批次完成，回傳第 k 批應插入的位置（前面最後一個成功批次的結尾）"""
+        for j in range(k - 1, -1, -1):
+            self._wait(self._done[j])
+            if self._end_pos[j] is not None:
+                return self._end_pos[j]
+            if not self.skip_failed:
+                raise _Aborted()  # 前面有批次失敗且不略過：不能接在更前面的位置
+        return self.start_position
+
+    def _send(self, k: int, chunk: List[str], position: int):
+        try:
+            if k > 0:
+                self._wait(self._started[k - 1])
+                gap = self._started_at[k - 1] + DISPATCH_GAP_SEC - time.monotonic()
+                if gap > 0:
+                    time.sleep(gap)
+            self._limiter.acquire()  # 依批次順序取額度，請求才會大致依序抵達
+            self._started_at[k] = time.monotonic()
+            self._started[k].set()
+            try:
+                self.post_chunk(chunk, position)
+            except PositionRejected:
+                with self._lock:
+                    self.stats["position_retries"] += 1
+                position = self._prefix_end(k)
+                self._limiter.acquire()
+                try:
+                    self.post_chunk(chunk, position)
+                except PositionRejected as e:
+                    raise RuntimeError(f"加入曲目失敗（position {position}）：{e}") from e
+            self._end_pos[k] = position + len(chunk)
+        finally:
+            self._started[k].set()
+            self._done[k].set()
+
+    def _settle_head(self):
+        chunk, fut = self._inflight[0]  # 等待中被中斷時仍留在 _inflight，abort() 會再確認一次
+        try:
+            fut.result()
+        except Exception:
+            self._inflight.popleft()
+            self.stats["chunks"] += 1
+            self.stats["failed"] += 1
+            if not self.skip_failed:
+                self._broken = True
+                self._aborted.set()
+                raise
+            self.queued -= len(chunk)  # 之後的批次往前遞補；已送出的會被拒絕並用實際位置重送
+            return
+        self._inflight.popleft()
+        self.stats["chunks"] += 1
+        self._ack(chunk)
+
+    def _ack(self, chunk: List[str]):
+        self.acked += len(chunk)
+        if self.on_ack:
+            self.on_ack(self.acked)
+
+    def close(self) -> int:
+        try:
+            while self._inflight:
+                self._settle_head()
+        finally:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+        return self.acked
+
+    def abort(self):
+        """
+        出錯或中斷時：取消尚未送出的批次，等已送出的完成，
+        再依序確認其中連續成功的前綴（on_ack），續傳時才不會重送已寫入的批次
+        """
+        self._aborted.set()
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        while self._inflight and not self._broken:
+            chunk, fut = self._inflight.popleft()
+            if fut.cancelled() or fut.exception() is not None:
+                if not self.skip_failed:
+                    break
+                continue
+            self.stats["chunks"] += 1
+            self._ack(chunk)
+        self._inflight.clear()
+
+    def summary(self) -> str:
+        s = self.stats
+        return f"upload: {s['chunks']} 批 | position 重送 {s['position_retries']} | 失敗 {s['failed']}"
+
+def upload_uris(post_chunk: PostChunk, uris: List[str], start_position: int = 0,
+                concurrency: int = UPLOAD_CONCURRENCY, on_ack: Optional[Callable[[int], None]] = None,
+                skip_failed: bool = False) -> int:
+    """把 uris 依序切成 CHUNK_SIZE 一批同時送出，回傳成功加入的首數"""
+    up = PipelinedUploader(post_chunk, start_position, concurrency, on_ack, skip_failed)
+    try:
+        for i in range(0, len(uris), CHUNK_SIZE):
+            up.add(uris[i:i + CHUNK_SIZE])
+        return up.close()
+    except BaseException:
+        up.abort()
+        raise
+
+# ---- token_helper 版本 ----
+
+def spotify_chunk_poster(playlist_id: str) -> PostChunk:
+    url = f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks"
+
+    def post_chunk(chunk: List[str], position: int):
+        try:
+            spotify_post(url, json_body={"uris": chunk, "position": position}, acquired=True)
+        except requests.HTTPError as e:
+            if is_position_error(e.response):
+                raise PositionRejected(str(e)) from e
+            raise
+
+    return post_chunk
+
+def spotify_playlist_length(playlist_id: str) -> int:
+    resp = spotify_get(f"https://api.spotify.com/v1/playlists/{playlist_id}", params={"fields": "tracks.total"})
+    return resp.json()["tracks"]["total"]
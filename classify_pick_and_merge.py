@@ -4,74 +4,62 @@
 # 2) 合併後分類成 7 份：中文 / 日文 / 韓文 / 英文 / 西班牙語 / 伴奏 / 其他
 # 3) 可填入 Genius Access Token（環境變數 GENIUS_API_TOKEN）以歌詞(lyrics)輔助判斷；未填則略過歌詞判斷
 # 4) 僅從 artist_lang_map.yaml 讀取「藝人→語言」對照（沒有就空表）
+# 5) 分類前先找出所有需要歌詞的列，以 LYRICS_WORKERS 個執行緒同時抓取；
+#    api.genius.com 與 genius.com 各用一個 rate limiter（rate_limiter.get_limiter）控制速率
+# 6) 歌詞判斷先看 Genius 歌曲資料（/songs/{id}）的 language 欄位（只採用 GENIUS_LANG_MAP 裡的語言），
+#    其他情況才下載歌詞網頁解析
 
 import csv
 import json
 import os
 import re
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Set, Optional
 from collections import Counter
+from urllib.parse import urlparse
 
-import requests
 from bs4 import BeautifulSoup
 
+from artist_matcher import ArtistMatcher, as_matcher
+from http_client import get_session
+from lyrics_cache import LyricsCache
+from rate_limiter import get_limiter, retry_after_seconds
+from script_detect import detect_lang, is_instrumental
+
 # ====== 可調參數 ======
 GENIUS_API_TOKEN_FALLBACK = ""   # 留空：優先走環境變數
 MAX_LYRICS_CHARS = 20000
 REQUEST_TIMEOUT = 12
-SLEEP_BETWEEN_REQ = 0.3  # 速度 vs 穩定性
+LYRICS_WORKERS = 6       # 同時抓歌詞的執行緒數；速率另由各主機的 rate limiter 控制
+GENIUS_MAX_RETRY = 3     # 429 時最多重試幾次
+# Genius 沒有公開速率上限，且 genius.com 網頁比 API 更容易擋；比 Spotify 的預設保守，429 時再自動降速
+GENIUS_INITIAL_RATE = 2.0  # 每秒請求數（每個主機各自計算）
+GENIUS_MIN_RATE = 0.2
+GENIUS_MAX_RATE = 5.0
+GENIUS_BURST = 3.0
+USE_SONG_METADATA = True # 先用 /songs/{id} 的 language 判斷；False 則一律下載歌詞網頁
+# Genius language 代碼 → 分類；不在表中的語言（如 yue、fr、pt）照舊下載歌詞網頁用文字判斷
+GENIUS_LANG_MAP = {"zh": "中文", "ja": "日文", "ko": "韓文", "en": "英文", "es": "西班牙語"}
+LANG_CODE_RE = re.compile(r"[a-z]{2,3}(-[a-z0-9]+)*", re.IGNORECASE)
 
 # YAML 檔案路徑（藝人→語言清單）
 ARTIST_YAML_PATH = Path("artist_lang_map.yaml")
 
-# ====== 語系偵測（Language Detection）=====
-def is_chinese(t: str) -> bool:
-    return re.search(r"[\u4e00-\u9fff]", t) is not None
-
-def is_japanese(t: str) -> bool:
-    return re.search(r"[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF]", t) is not None
-
-def is_korean(t: str) -> bool:
-    return re.search(r"[\uac00-\ud7af]", t) is not None
-
-def is_spanish(t: str) -> bool:
-    # 常見西班牙語元音與 ñ, ¡, ¿ 等符號
-    return re.search(r"[ñáéíóúü¡¿]", t, re.IGNORECASE) is not None
-
-def is_english(t: str) -> bool:
-    if not t:
-        return False
-    if is_chinese(t) or is_japanese(t) or is_korean(t) or is_spanish(t):
-        return False
-    letters = re.findall(r"[A-Za-z]", t)
-    return len(letters) >= 3
-
-def is_instrumental(t: str) -> bool:
-    kw = [
-        "instrumental", "伴奏", "karaoke", "off vocal", "minus one", "inst",
-        "バックトラック", "노래방", "mr "
-    ]
-    tl = t.lower()
-    return any(k in tl for k in kw)
-
-# ====== 快取（lyrics_cache.json）=====
-CACHE_PATH = Path("lyrics_cache.json")
-
-def load_cache() -> Dict[str, str]:
-    if CACHE_PATH.exists():
-        try:
-            return json.loads(CACHE_PATH.read_text(encoding="utf-8"))
-        except Exception:
-            return {}
-    return {}
-
-def save_cache(cache: Dict[str, str]) -> None:
-    try:
-        CACHE_PATH.write_text(json.dumps(cache, ensure_ascii=False, indent=2), encoding="utf-8")
-    except Exception:
-        pass
+# ====== 快取（lyrics_cache.db，見 lyrics_cache.py）=====
+CACHE_PATH = Path("lyrics_cache.json")  # 舊版快取；第一次執行時匯入 lyrics_cache.db
+
+def load_cache() -> LyricsCache:
+    cache = LyricsCache()
+    cache.migrate_json(CACHE_PATH, detect_lang)
+    cache.prune()
+    return cache
+
+def save_cache(cache: LyricsCache) -> None:
+    """每首歌抓完時已寫入；這裡只套用筆數 / 大小上限並列出統計"""
+    cache.prune()
+    print(cache.summary())
 
 def cache_key(title: str, artist: str) -> str:
     return json.dumps([title.strip(), artist.strip()], ensure_ascii=False)
@@ -101,57 +89,123 @@ def load_artist_map_from_yaml(yaml_path: Path) -> Dict[str, str]:
         print(f"⚠️ YAML 載入失敗：{e}\nℹ️ 將只用歌詞/字元偵測作為後援分類。")
         return {}
 
-def build_artist_lang_map() -> Dict[str, str]:
-    return load_artist_map_from_yaml(ARTIST_YAML_PATH)
+def build_artist_lang_map() -> ArtistMatcher:
+    """回傳編譯好的比對器（artist_matcher.py）；.artist_map 是原本的 dict"""
+    return ArtistMatcher(load_artist_map_from_yaml(ARTIST_YAML_PATH))
 
 # ====== Genius 歌詞（Lyrics）======
 def get_genius_token() -> str:
     return os.environ.get("GENIUS_API_TOKEN") or GENIUS_API_TOKEN_FALLBACK or ""
 
-def fetch_lyrics(title: str, artist: str, cache: Dict[str, str]) -> str:
+def genius_get(url: str, **kwargs):
+    """依主機（api.genius.com / genius.com）取得各自的 rate limiter 額度再送出；429 時降速重試"""
+    limiter = get_limiter(urlparse(url).hostname, initial_rate=GENIUS_INITIAL_RATE, min_rate=GENIUS_MIN_RATE,
+                          max_rate=GENIUS_MAX_RATE, burst=GENIUS_BURST)
+    for _ in range(GENIUS_MAX_RETRY):
+        limiter.acquire()
+        r = get_session().get(url, timeout=REQUEST_TIMEOUT, **kwargs)
+        if r.status_code == 429:
+            limiter.on_rate_limited(retry_after_seconds(r))
+            continue
+        limiter.on_success()
+        return r
+    raise RuntimeError(f"GET {url} 一直收到 429")
+
+lookup_stats = {"metadata": 0, "scraped": 0, "failed": 0}
+_stats_lock = threading.Lock()
+_failed_keys: Set[str] = set()  # 這次執行暫時失敗的歌（不寫入快取；同一次執行不再重試）
+
+def _count_lookup(name: str):
+    with _stats_lock:
+        lookup_stats[name] += 1
+
+def lookup_summary() -> str:
+    s = lookup_stats
+    return (f"歌詞判斷：用歌曲資料 {s['metadata']} 首（省下 {s['metadata']} 次網頁下載）"
+            f" | 下載歌詞網頁 {s['scraped']} 首 | 暫時失敗 {s['failed']} 首（未寫入快取，下次執行再試）")
+
+def search_top_hit(title: str, artist: str, token: str) -> Optional[dict]:
+    """Genius 搜尋的第一筆結果（含 id / url）；沒有結果回傳 None，token 無效等錯誤會丟出例外"""
+    r = genius_get(
+        "https://api.genius.com/search",
+        headers={"Authorization": f"Bearer {token}"},
+        params={"q": f"{title} {artist}"},
+    )
+    r.raise_for_status()
+    hits = r.json().get("response", {}).get("hits", [])
+    return hits[0]["result"] if hits else None
+
+def song_language(song_id, token: str) -> Optional[str]:
+    """/songs/{id} 的 language（例如 en、zh、ja）；沒有或不是語言代碼（如 romanization）時回傳 None"""
+    r = genius_get(
+        f"https://api.genius.com/songs/{song_id}",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    if not r.ok:
+        return None
+    code = (r.json().get("response", {}).get("song") or {}).get("language") or ""
+    return code if LANG_CODE_RE.fullmatch(code) else None
+
+def language_verdict(code: Optional[str]) -> Optional[str]:
+    """GENIUS_LANG_MAP 裡的語言才回傳分類，其他回傳 None"""
+    return GENIUS_LANG_MAP.get(code.split("-")[0].lower()) if code else None
+
+def scrape_lyrics(song_url: str) -> str:
+    """下載歌詞網頁並取出歌詞；頁面不存在（404）視為沒有歌詞，其他錯誤丟出例外"""
+    r = genius_get(song_url)
+    if r.status_code == 404:
+        return ""
+    r.raise_for_status()
+    html = r.text
+    soup = BeautifulSoup(html, "lxml")
+
+    parts = []
+    for div in soup.select('div[data-lyrics-container="true"]'):
+        parts.append(div.get_text(separator="\n"))
+    if not parts:
+        for div in soup.select("div.Lyrics__Container-sc-1ynbvzw-1"):
+            parts.append(div.get_text(separator="\n"))
+    if not parts:
+        for p in soup.select("div.lyrics p"):
+            parts.append(p.get_text(separator="\n"))
+
+    lyrics = "\n".join(parts).strip()
+    return re.sub(r"\n{3,}", "\n\n", lyrics)[:MAX_LYRICS_CHARS]
+
+def lyrics_lang(title: str, artist: str, cache: LyricsCache) -> Optional[str]:
+    """
+    依 Genius 判斷語言（先查快取）；沒有 token 時不判斷。
+    搜尋第一筆結果的歌曲資料的 language 在 GENIUS_LANG_MAP 裡時直接採用（歌名是伴奏則為伴奏），
+    其他情況才下載歌詞網頁用文字判斷。
+    只有「搜尋沒有結果」與「有結果但沒有歌詞」會記進快取；網路錯誤、429 重試用完、token 無效等
+    暫時性失敗不寫入快取，下次執行會再試。
+    """
     token = get_genius_token()
     if not token:
-        return ""
+        return None
     key = cache_key(title, artist)
-    if key in cache:
-        return cache[key]
-
-    headers = {"Authorization": f"Bearer {token}"}
+    hit, verdict = cache.get(key)
+    if hit or key in _failed_keys:
+        return verdict
+    lyrics, verdict = "", None
     try:
-        r = requests.get(
-            "https://api.genius.com/search",
-            headers=headers,
-            params={"q": f"{title} {artist}"},
-            timeout=REQUEST_TIMEOUT,
-        )
-        hits = r.json().get("response", {}).get("hits", [])
-        if not hits:
-            cache[key] = ""
-            return ""
-
-        song_url = hits[0]["result"]["url"]
-        html = requests.get(song_url, timeout=REQUEST_TIMEOUT).text
-        soup = BeautifulSoup(html, "lxml")
-
-        parts = []
-        for div in soup.select('div[data-lyrics-container="true"]'):
-            parts.append(div.get_text(separator="\n"))
-        if not parts:
-            for div in soup.select("div.Lyrics__Container-sc-1ynbvzw-1"):
-                parts.append(div.get_text(separator="\n"))
-        if not parts:
-            for p in soup.select("div.lyrics p"):
-                parts.append(p.get_text(separator="\n"))
-
-        lyrics = "\n".join(parts).strip()
-        lyrics = re.sub(r"\n{3,}", "\n\n", lyrics)[:MAX_LYRICS_CHARS]
-
-        cache[key] = lyrics
-        time.sleep(SLEEP_BETWEEN_REQ)
-        return lyrics
-    except Exception:
-        cache[key] = ""
-        return ""
+        song = search_top_hit(title, artist, token)
+        meta = None
+        if song and USE_SONG_METADATA and song.get("id") is not None:
+            meta = language_verdict(song_language(song["id"], token))
+        if meta:
+            verdict = "伴奏" if is_instrumental(title) else meta
+            _count_lookup("metadata")
+        elif song:
+            lyrics = scrape_lyrics(song["url"])
+            verdict = detect_lang(lyrics)
+            _count_lookup("scraped")
+    except Exception:  # 不是「找不到」而是這次沒查成功：不記進快取
+        _failed_keys.add(key)
+        _count_lookup("failed")
+        return None
+    cache.put(key, lyrics, verdict)
+    return verdict
 
 # ====== 讀寫 CSV ======
 REQ_COLS = ["Title", "Artist", "Album", "TrackURI"]
@@ -217,13 +271,13 @@ def split_artists(artist_field: str) -> List[str]:
     parts = SEP_PATTERN.split(artist_field)
     return [p.strip() for p in parts if p.strip()]
 
-def vote_lang_by_yaml(artists: List[str], artist_map: Dict[str, str]) -> Optional[str]:
+def vote_lang_by_yaml(artists: List[str], artist_map) -> Optional[str]:
+    matcher = as_matcher(artist_map)
     votes: List[str] = []
     for a in artists:
-        for key, lang in artist_map.items():
-            if key.lower() in a.lower():
-                votes.append(lang)
-                break
+        lang = matcher.first(a)
+        if lang is not None:
+            votes.append(lang)
     if not votes:
         return None
     uniq = set(votes)
@@ -236,47 +290,69 @@ def vote_lang_by_yaml(artists: List[str], artist_map: Dict[str, str]) -> Optiona
     return None
 
 # ====== 單首分類（Classification）======
-def classify_row(row: Dict[str, str], cache: Dict[str, str],
-                 artist_map: Dict[str, str], unknown_artists: Set[str]) -> str:
-    artist = row.get("Artist", "") or ""
-    title  = row.get("Title", "")  or ""
-    album  = row.get("Album", "")  or ""
-
+def artist_lang(artist: str, matcher: ArtistMatcher) -> Optional[str]:
+    """只靠 YAML 判斷：多藝人先投票，再找單一藝人；都不符合回傳 None"""
     # 0) 多藝人 → YAML 判斷
     artists_list = split_artists(artist)
     if len(artists_list) >= 2:
-        yaml_lang = vote_lang_by_yaml(artists_list, artist_map)
+        yaml_lang = vote_lang_by_yaml(artists_list, matcher)
         if yaml_lang:
             return yaml_lang
 
     # 1) YAML 單藝人
-    matched = False
-    for key, lang in artist_map.items():
-        if key.lower() in artist.lower():
-            matched = True
-            return lang
-    if not matched and artist.strip():
+    return matcher.first(artist)
+
+def classify_row(row: Dict[str, str], cache: LyricsCache,
+                 artist_map, unknown_artists: Set[str]) -> str:
+    """artist_map：ArtistMatcher（或一般 dict，會當場編譯，較慢）"""
+    artist_map = as_matcher(artist_map)
+    artist = row.get("Artist", "") or ""
+    title  = row.get("Title", "")  or ""
+    album  = row.get("Album", "")  or ""
+
+    lang = artist_lang(artist, artist_map)
+    if lang is not None:
+        return lang
+    if artist.strip():
         unknown_artists.add(artist.strip())
 
-    # 2) 歌詞判斷
-    lyrics = fetch_lyrics(title, artist, cache)
-    if lyrics:
-        if is_instrumental(lyrics): return "伴奏"
-        if is_chinese(lyrics):      return "中文"
-        if is_japanese(lyrics):     return "日文"
-        if is_korean(lyrics):       return "韓文"
-        if is_spanish(lyrics):      return "西班牙語"
-        if is_english(lyrics):      return "英文"
+    # 2) 歌詞判斷（script_detect：一次統計各文字系統字數，結果與原本逐一用 regex 判斷相同）
+    lang = lyrics_lang(title, artist, cache)
+    if lang:
+        return lang
 
     # 3) fallback
-    text = f"{title} {album} {artist}"
-    if is_instrumental(text): return "伴奏"
-    if is_chinese(text):      return "中文"
-    if is_japanese(text):     return "日文"
-    if is_korean(text):       return "韓文"
-    if is_spanish(text):      return "西班牙語"
-    if is_english(text):      return "英文"
-    return "其他"
+    return detect_lang(f"{title} {album} {artist}") or "其他"
+
+# ====== 歌詞預先抓取（Prefetch）======
+def prefetch_lyrics(rows: List[Dict[str, str]], cache: LyricsCache, artist_map,
+                    workers: int = LYRICS_WORKERS) -> int:
+    """
+    找出 YAML 判斷不了、快取裡也沒有歌詞的列（同一首只抓一次），用執行緒池同時抓取並存進 cache；
+    之後 classify_row 直接讀快取。回傳實際抓取的首數。
+    """
+    if not get_genius_token():
+        return 0
+    matcher = as_matcher(artist_map)
+    todo = {}
+    for r in rows:
+        title, artist = r.get("Title", "") or "", r.get("Artist", "") or ""
+        key = cache_key(title, artist)
+        if key not in cache and key not in todo and artist_lang(artist, matcher) is None:
+            todo[key] = (title, artist)
+    if not todo:
+        return 0
+    print(f"🎼 需要抓歌詞：{len(todo)} 首（{workers} 個執行緒同時進行）")
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = [pool.submit(lyrics_lang, title, artist, cache) for title, artist in todo.values()]
+        for i, fut in enumerate(futures, start=1):
+            fut.result()
+            if i % 50 == 0 or i == len(futures):
+                print(f"歌詞進度：{i}/{len(futures)}")
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)  # 中斷時不再送出還沒開始的請求
+    return len(todo)
 
 # ====== 檔案選擇（GUI）======
 def pick_files_gui() -> List[Path]:
@@ -323,6 +399,7 @@ def main():
 
     cache = load_cache()
     unknown_artists: Set[str] = set()
+    prefetch_lyrics(all_rows, cache, artist_map)
 
     for i, r in enumerate(all_rows, start=1):
         cat = classify_row(r, cache, artist_map, unknown_artists)
@@ -345,6 +422,7 @@ def main():
         print(f"📝 已輸出未知藝人名單：{unknown_path}")
 
     save_cache(cache)
+    print(lookup_summary())
 
     if total_info:
         print("—— 統計 ——")
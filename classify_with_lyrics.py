@@ -1,10 +1,11 @@
 # classify_with_lyrics.py
 import csv
 import re
-import requests
 from pathlib import Path
 from typing import Dict, List
 
+from http_client import get_session
+
 INPUT_FILES = [
     r"C:\Users\USER\Downloads\csv_playlists\csv2spotify_playlist\playlist_中文_final_with_uri_album_v2.csv",
     r"C:\Users\USER\Downloads\csv_playlists\csv2spotify_playlist\playlist_日文_final_with_uri_album_v2.csv",
@@ -44,14 +45,14 @@ def fetch_lyrics(title: str, artist: str) -> str:
     search_url = "https://api.genius.com/search"
     params = {"q": f"{title} {artist}"}
     try:
-        response = requests.get(search_url, headers=headers, params=params, timeout=10)
+        response = get_session().get(search_url, headers=headers, params=params, timeout=10)
         data = response.json()
         hits = data.get("response", {}).get("hits", [])
         if not hits:
             return ""
         song_url = hits[0]["result"]["url"]
         # 簡單取歌詞網頁文字（需要額外套件可用 BeautifulSoup 解析乾淨版）
-        page = requests.get(song_url, timeout=10).text
+        page = get_session().get(song_url, timeout=10).text
         return page[:3000]  # 避免太長
     except Exception as e:
         print(f"⚠️ 抓歌詞失敗 {title} - {artist}: {e}")
@@ -2,18 +2,32 @@
 # 功能：
 # 1) 自動掃描資料夾內的 playlist_*_final.csv
 # 2) 每個 CSV 建立同名的 Spotify 播放清單
-# 3) 搜尋並加入曲目，顯示進度與 ETA
+# 3) 搜尋並加入曲目（邊搜尋邊分批加入），顯示進度與 ETA
 # 4) 產生各自的匯入失敗報表 import_report_<清單名>.csv
 # 5) 輸出執行過程到 csv2playlist.log 方便追蹤
+# 6) 中斷後可用 --resume 依 import_journal_<清單名>.jsonl 續傳
 #
 # 需要同資料夾的 token_helper.py 與 tokens.json
 
+import argparse
+import asyncio
 import csv
+import queue
+import threading
 import time
+from collections import deque
+from contextlib import closing
+from itertools import islice
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Callable, Deque, Iterable, Iterator, List, Optional, Tuple
 
-from token_helper import spotify_get, spotify_post
+from batch_upload import MAX_UNACKED, PipelinedUploader, spotify_chunk_poster, spotify_playlist_length
+from import_journal import ImportJournal
+from search_cache import get_search_cache
+from spotify_async import AsyncSpotify
+from token_helper import spotify_get, spotify_post, token_stats
+from track_matcher import SEARCH_ENDPOINT, TrackMatcher
 
 # === 你的設定 ===
 USER_ID = "shxdmnb7i6yvw3fvbsjt7mgdf"  # /v1/me 回傳的 id
@@ -21,6 +35,13 @@ CSV_DIR = Path(r"C:\Users\USER\Downloads\csv_playlists")  # 放 CSV 的資料夾
 CSV_GLOB = "playlist_*_final.csv"  # 要處理的檔名樣式
 SEARCH_MARKET = "TW"  # 搜尋市場（market）
 LOG_FILE = CSV_DIR / "csv2playlist.log"  # 日誌檔
+SEARCH_WORKERS = 8  # 並行搜尋的 worker 數；設為 1 即逐首搜尋
+ASYNC_SEARCH = False  # True：改用 asyncio 版本搜尋（spotify_async）
+SEARCH_CONCURRENCY = 8  # 非同步搜尋的同時請求數
+ADD_BATCH_SIZE = 100  # Spotify 一次最多加入 100 首
+QUEUE_POLL_SEC = 0.5  # queue 已滿時每隔多久確認一次消費者是否已出錯
+
+matcher = TrackMatcher(market=SEARCH_MARKET)  # 共用比對引擎（含 search_cache）
 
 # ====== 工具函數 ======
 
@@ -54,10 +75,6 @@ def progress_line(done: int, total: int, found: int, not_found: int, start_ts: f
     pct = (done / total * 100) if total > 0 else 0
     return f"{done}/{total} ({pct:.1f}%) | OK {found} / NF {not_found} | elapsed {format_eta(elapsed)} | eta {format_eta(eta)}"
 
-def chunked(lst: List[str], size: int):
-    for i in range(0, len(lst), size):
-        yield lst[i:i + size]
-
 # ====== Spotify 呼叫 ======
 
 def create_playlist(name: str, public: bool, desc: str) -> str:
@@ -67,112 +84,267 @@ def create_playlist(name: str, public: bool, desc: str) -> str:
     )
     return resp.json()["id"]
 
-def search_track(title: str, artist: str, album: Optional[str], market: str) -> Optional[str]:
-    """
-    搜尋策略（由嚴到鬆）：
-      1) title + artist + album
-      2) title + artist
-      3) 只用 title
-    回傳 spotify:track:... 的 URI 或 None
-    """
-    def _run(q: str) -> Optional[str]:
-        resp = spotify_get(
-            "https://api.spotify.com/v1/search",
-            params={"q": q, "type": "track", "limit": 1, "market": market},
-        )
-        items = resp.json().get("tracks", {}).get("items", [])
-        return items[0]["uri"] if items else None
-
-    title_q = f'track:"{title}"'
-    artist_q = f'artist:"{artist}"' if artist else ""
-    album_q = f'album:"{album}"' if album else ""
-
-    if artist and album:
-        uri = _run(f"{title_q} {artist_q} {album_q}")
-        if uri:
-            return uri
-    if artist:
-        uri = _run(f"{title_q} {artist_q}")
-        if uri:
-            return uri
-    return _run(title_q)
+def search_track(title: str, artist: str, album: Optional[str]) -> Optional[str]:
+    """交給 track_matcher：一次取回多筆候選在本機打分，信心不足才再查一次；回傳 URI 或 None"""
+    artists = [artist] if artist else []
+    return matcher.match(lambda params: spotify_get(SEARCH_ENDPOINT, params=params).json(),
+                         title, artists, album).uri
 
-def add_tracks(playlist_id: str, uris: List[str]):
-    if not uris:
-        return
-    for batch in chunked(uris, 100):
-        spotify_post(
-            f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks",
-            json_body={"uris": batch},
-        )
-        time.sleep(0.2)  # 避免觸發速率限制(rate limit)
+async def search_track_async(client: AsyncSpotify, title: str, artist: str, album: Optional[str]) -> Optional[str]:
+    """search_track 的非同步版本；同一首歌的查詢仍依序，不同歌曲之間並行。"""
+    async def _fetch(params: dict) -> dict:
+        return (await client.get(SEARCH_ENDPOINT, params=params)).json()
+
+    artists = [artist] if artist else []
+    return (await matcher.match_async(_fetch, title, artists, album)).uri
 
 # ====== 主要流程 ======
 
-def read_csv_rows(file_path: Path) -> List[dict]:
+def iter_csv_rows(file_path: Path) -> Iterator[dict]:
+    """逐列讀取 CSV，不把整個檔案載入記憶體"""
     with file_path.open("r", encoding="utf-8-sig", newline="") as f:
-        return list(csv.DictReader(f))
+        yield from csv.DictReader(f)
 
-def write_report(file_path: Path, rows: List[Tuple[str, str, str, str]]):
-    # rows: [(Title, Artist, Album, Status), ...]
-    with file_path.open("w", encoding="utf-8", newline="") as fo:
-        writer = csv.writer(fo)
-        writer.writerow(["Title", "Artist", "Album", "Status"])
-        writer.writerows(rows)
+def count_csv_rows(file_path: Path) -> int:
+    with file_path.open("r", encoding="utf-8-sig", newline="") as f:
+        return max(0, sum(1 for _ in csv.reader(f)) - 1)  # 扣掉標題列
 
-def process_csv(file_path: Path):
-    playlist_name = file_path.stem  # 播放清單名稱直接用檔名
-    log(f"=== 開始處理 {file_path.name} → 新建清單: {playlist_name} ===")
-    playlist_id = create_playlist(playlist_name, public=False, desc="Imported from CSV")
-    log(f"Playlist ID: {playlist_id}")
+def row_fields(row: dict) -> Tuple[str, str, str]:
+    title = (row.get("Title") or "").strip()
+    artist = (row.get("Artist") or "").strip()
+    album = (row.get("Album") or "").strip()
+    return title, artist, album
+
+class SearchProgress:
+    """多個 worker 共用的進度計數；每完成 10 首用 progress_line 記錄一次"""
+
+    def __init__(self, total: int, start_ts: float):
+        self.total = total
+        self.start_ts = start_ts
+        self.done = 0
+        self.found = 0
+        self._lock = threading.Lock()
+
+    def record(self, found: bool):
+        with self._lock:
+            self.done += 1
+            if found:
+                self.found += 1
+            if self.done % 10 == 0 or self.done == self.total:
+                log(progress_line(self.done, self.total, self.found, self.done - self.found, self.start_ts))
+
+class PlaylistAdder(threading.Thread):
+    """
+    消費者(consumer)：從 queue 取出 URI，每滿 ADD_BATCH_SIZE 首就交給 PipelinedUploader 送出，
+    多批可同時進行（帶 position，順序不變）；日誌只記錄已確認的連續前綴。
+    queue 有上限，搜尋太快時生產者會被擋住，記憶體用量不會隨 CSV 大小成長。
+    """
+
+    def __init__(self, playlist_id: str, journal: Optional[ImportJournal] = None, start_position: int = 0):
+        super().__init__(name="playlist-adder", daemon=True)
+        self.playlist_id = playlist_id
+        self.journal = journal
+        self.start_position = start_position  # 新清單為 0；續傳時為清單目前的長度
+        self.already_added = journal.added if journal else 0  # 續傳時先前已確認加入的首數
+        self.queue: "queue.Queue[Optional[str]]" = queue.Queue(maxsize=ADD_BATCH_SIZE * 4)
+        self.added = 0
+        self.error: Optional[BaseException] = None
+
+    def _on_ack(self, acked: int):
+        self.added = acked
+        if self.journal:
+            self.journal.record_batch(self.already_added + acked)
+
+    def run(self):
+        batch: List[str] = []
+        uploader = None
+        try:
+            uploader = PipelinedUploader(spotify_chunk_poster(self.playlist_id), self.start_position,
+                                         on_ack=self._on_ack)
+            while True:
+                uri = self.queue.get()
+                if uri is not None:
+                    batch.append(uri)
+                if len(batch) >= ADD_BATCH_SIZE or (uri is None and batch):
+                    uploader.add(batch)
+                    batch = []
+                if uri is None:
+                    uploader.close()
+                    return
+        except BaseException as e:
+            self.error = e
+            if uploader is not None:
+                uploader.abort()
+
+    def _put(self, item: Optional[str]) -> bool:
+        """放進 queue；消費者已出錯時回傳 False（queue 滿了也不會一直卡住）"""
+        while self.error is None:
+            try:
+                self.queue.put(item, timeout=QUEUE_POLL_SEC)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _raise_error(self):
+        raise RuntimeError(f"加入曲目失敗：{self.error}") from self.error
 
-    rows = read_csv_rows(file_path)
-    total = len(rows)
+    def put(self, uri: str):
+        if not self._put(uri):
+            self._raise_error()
+
+    def close(self):
+        """送出最後一批（不足 100 首也送）並等待完成"""
+        self._put(None)
+        self.join()
+        if self.error is not None:
+            self._raise_error()
+
+def _resolve_one(row: dict) -> Optional[str]:
+    title, artist, album = row_fields(row)
+    if not title:
+        return None
+    return search_track(title, artist, album or None)
+
+def resolve_rows(items: Iterable[Tuple[int, dict]], progress: SearchProgress,
+                 journal: ImportJournal) -> Iterator[Tuple[dict, Optional[str]]]:
+    """
+    以 worker pool 並行搜尋，依 CSV 順序逐列回傳 (row, uri)。
+    日誌裡已搜尋過的列直接沿用結果；新搜尋的結果寫入日誌。
+    同時排隊的工作最多 SEARCH_WORKERS * 4 個；中斷時取消尚未開始的搜尋，並等進行中的搜尋寫完日誌。
+    """
+    def _task(index: int, row: dict) -> Optional[str]:
+        if index in journal.resolved:
+            uri = journal.resolved[index]
+        else:
+            uri = _resolve_one(row)
+            journal.record_row(index, uri)
+        progress.record(uri is not None)
+        return uri
+
+    pool = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="search")
+    pending: Deque[Tuple[dict, Future]] = deque()
+    try:
+        for index, row in items:
+            pending.append((row, pool.submit(_task, index, row)))
+            if len(pending) >= SEARCH_WORKERS * 4:
+                head_row, fut = pending.popleft()
+                yield head_row, fut.result()
+        while pending:
+            head_row, fut = pending.popleft()
+            yield head_row, fut.result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+async def resolve_rows_async(items: Iterable[Tuple[int, dict]], progress: SearchProgress,
+                             journal: ImportJournal, on_result: Callable[[dict, Optional[str]], None]):
+    """asyncio 版：每次並行搜尋 SEARCH_CONCURRENCY * 4 列，整批完成後依 CSV 順序交給 on_result"""
+    async with AsyncSpotify(concurrency=SEARCH_CONCURRENCY) as client:
+        async def _one(index: int, row: dict) -> Optional[str]:
+            if index in journal.resolved:
+                uri = journal.resolved[index]
+            else:
+                title, artist, album = row_fields(row)
+                uri = None
+                if title:
+                    uri = await search_track_async(client, title, artist, album or None)
+                journal.record_row(index, uri)
+            progress.record(uri is not None)
+            return uri
+
+        it = iter(items)
+        while True:
+            window = list(islice(it, SEARCH_CONCURRENCY * 4))
+            if not window:
+                break
+            uris = await asyncio.gather(*(_one(index, row) for index, row in window))
+            for (_, row), uri in zip(window, uris):
+                on_result(row, uri)
+
+def process_csv(file_path: Path, resume: bool = False):
+    playlist_name = file_path.stem  # 播放清單名稱直接用檔名
+    total = count_csv_rows(file_path)
     if total == 0:
-        log("此 CSV 無資料，略過")
+        log(f"{file_path.name} 無資料，略過")
+        return
+
+    journal = ImportJournal(file_path, resume=resume)
+    if journal.done:
+        log(f"{file_path.name} 先前已匯入完成，略過（日誌：{journal.path.name}）")
+        journal.close()
         return
+    if journal.resuming:
+        playlist_id = journal.playlist_id
+        log(f"=== 續傳 {file_path.name}：已搜尋 {len(journal.resolved)} 列，已加入 {journal.added} 首 ===")
+        start = spotify_playlist_length(playlist_id)  # 接在清單目前的最後面
+        surplus = journal.reconcile(start, MAX_UNACKED)
+        if surplus:
+            log(f"清單比日誌多 {surplus} 首（上次已寫入、尚未記錄確認的批次），不再重送")
+    else:
+        if resume and journal.stale:
+            log("⚠️ CSV 在上次匯入後被修改過，無法續傳，重新開始")
+        log(f"=== 開始處理 {file_path.name} → 新建清單: {playlist_name} ===")
+        playlist_id = create_playlist(playlist_name, public=False, desc="Imported from CSV")
+        journal.start(playlist_id)
+        journal.record_base(0)
+        start = 0
+    log(f"Playlist ID: {playlist_id}")
 
     start_ts = time.time()
-    found_uris: List[str] = []
-    not_found_rows: List[Tuple[str, str, str, str]] = []
+    progress = SearchProgress(total, start_ts)
+    report_file = file_path.with_name(f"import_report_{playlist_name}.csv")
+    not_found = 0
+    found_seen = 0
+    completed = False  # 只有整份 CSV 正常跑完才寫 done
 
-    try:
-        for idx, row in enumerate(rows, start=1):
-            title = (row.get("Title") or "").strip()
-            artist = (row.get("Artist") or "").strip()
-            album = (row.get("Album") or "").strip()
+    # 搜尋(生產者) → queue → 加入播放清單(消費者)；找到的歌依 CSV 順序邊搜尋邊加入
+    adder = PlaylistAdder(playlist_id, journal, start)
+    adder.start()
+    with report_file.open("w", encoding="utf-8", newline="") as fo:
+        writer = csv.writer(fo)
+        writer.writerow(["Title", "Artist", "Album", "Status"])
+
+        def _collect(row: dict, uri: Optional[str]):
+            nonlocal not_found, found_seen
+            if uri:
+                found_seen += 1
+                if found_seen > adder.already_added:  # 續傳時跳過已確認加入的曲目
+                    adder.put(uri)
+                return
+            title, artist, album = row_fields(row)
+            writer.writerow((title, artist, album, "No title" if not title else "Not found"))
+            not_found += 1
 
-            if not title:
-                not_found_rows.append((title, artist, album, "No title"))
+        try:
+            items = enumerate(iter_csv_rows(file_path))
+            if ASYNC_SEARCH:
+                asyncio.run(resolve_rows_async(items, progress, journal, _collect))
             else:
-                uri = search_track(title, artist, album or None, market=SEARCH_MARKET)
-                if uri:
-                    found_uris.append(uri)
-                else:
-                    not_found_rows.append((title, artist, album, "Not found"))
-
-            # 每 10 首更新一次進度
-            if idx % 10 == 0 or idx == total:
-                ok = len(found_uris)
-                nf = len(not_found_rows)
-                log(progress_line(idx, total, ok, nf, start_ts))
-
-    except KeyboardInterrupt:
-        log("偵測到中斷，將寫入目前已找到的歌曲並輸出報表...")
-
-    # 寫入播放清單
-    log(f"開始加入曲目，共 {len(found_uris)} 首")
-    add_tracks(playlist_id, found_uris)
-    log("加入曲目完成")
-
-    # 產出報表
-    report_file = file_path.with_name(f"import_report_{playlist_name}.csv")
-    write_report(report_file, not_found_rows)
-    log(f"⚠️ 未匹配歌曲數量: {len(not_found_rows)}，報表：{report_file.resolve()}")
+                with closing(resolve_rows(items, progress, journal)) as resolved:
+                    for row, uri in resolved:
+                        _collect(row, uri)
+            completed = True
+        except KeyboardInterrupt:
+            log("偵測到中斷，將寫入目前已找到的歌曲並輸出報表（可用 --resume 續傳）...")
+        finally:
+            try:
+                adder.close()
+                if completed:  # 例外或中斷時保留日誌，讓 --resume 接續
+                    journal.finish()
+            finally:
+                journal.close()
+
+    log(f"加入曲目完成，本次加入 {adder.added} 首（累計 {adder.already_added + adder.added} 首）")
+    log(f"⚠️ 未匹配歌曲數量: {not_found}，報表：{report_file.resolve()}")
     log(f"=== 完成 {playlist_name}，總耗時 {format_eta(time.time() - start_ts)} ===")
 
 def main():
-    LOG_FILE.write_text("", encoding="utf-8")  # 開始前清空日誌
+    ap = argparse.ArgumentParser(description="依 Title/Artist/Album 搜尋並把 CSV 匯入 Spotify 播放清單")
+    ap.add_argument("--resume", action="store_true", help="依 import_journal_<檔名>.jsonl 從上次確認的批次續傳")
+    args = ap.parse_args()
+
+    if not args.resume:
+        LOG_FILE.write_text("", encoding="utf-8")  # 開始前清空日誌
     log(f"掃描資料夾：{CSV_DIR.resolve()}，樣式：{CSV_GLOB}")
     csv_files = sorted(CSV_DIR.glob(CSV_GLOB))
     if not csv_files:
@@ -180,9 +352,12 @@ def main():
         return
 
     for f in csv_files:
-        process_csv(f)
+        process_csv(f, resume=args.resume)
 
     log("全部清單處理完成")
+    log(matcher.summary())
+    log(get_search_cache().summary())
+    log(token_stats())
 
 if __name__ == "__main__":
     main()
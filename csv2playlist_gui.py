@@ -15,16 +15,15 @@ from typing import List, Tuple
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 
-from token_helper import spotify_post  # 沿用你的 token_helper
+from batch_upload import spotify_chunk_poster, upload_uris
+from token_helper import spotify_post, token_stats  # 沿用你的 token_helper
 
 # === 你的設定 ===
 USER_ID = "shxdmnb7i6yvw3fvbsjt7mgdf"
 
-# Spotify 一次最多加入 100 首
-BATCH_SIZE = 100
+# 每批 100 首、同時送出的批次數見 batch_upload.py
 
-# 速率限制保守延遲
-SLEEP_AFTER_BATCH_SEC = 0.2
+# 速率限制由 token_helper 的共用 rate limiter（rate_limiter.py）控制，不再固定 sleep
 
 
 # -----------------------------
@@ -66,15 +65,10 @@ def create_playlist(user_id: str, name: str, public: bool, desc: str) -> str:
 
 
 def add_tracks(playlist_id: str, uris: List[str], log_cb, progress_cb) -> int:
-    total_added = 0
+    """新清單從 position 0 開始；batch_upload 多批同時送出，進度依已確認的批次更新"""
     start_ts = time.time()
-    for i in range(0, len(uris), BATCH_SIZE):
-        batch = uris[i:i + BATCH_SIZE]
-        spotify_post(
-            f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks",
-            json_body={"uris": batch},
-        )
-        total_added += len(batch)
+
+    def on_ack(total_added: int):
         elapsed = time.time() - start_ts
         rate = total_added / elapsed if elapsed > 0 else 0.0
         remain = len(uris) - total_added
@@ -82,8 +76,8 @@ def add_tracks(playlist_id: str, uris: List[str], log_cb, progress_cb) -> int:
         # UI 更新
         progress_cb(total_added, len(uris))
         log_cb(f"已加入 {total_added}/{len(uris)} | elapsed {format_eta(elapsed)} | eta {format_eta(eta)}")
-        time.sleep(SLEEP_AFTER_BATCH_SEC)
-    return total_added
+
+    return upload_uris(spotify_chunk_poster(playlist_id), uris, 0, on_ack=on_ack)
 
 
 # -----------------------------
@@ -255,6 +249,7 @@ class CSV2PlaylistGUI:
                 )
             self.set_status("全部清單處理完成")
             self.log("全部清單處理完成")
+            self.log(token_stats())
         except Exception as e:
             self.set_status("發生錯誤，請查看日誌")
             self.log(f"❌ 發生例外：{e}")
@@ -1,9 +1,14 @@
 # csv2playlist_uri.py
+import argparse
 import csv
 import time
 from pathlib import Path
-from typing import List
-from token_helper import spotify_post  # 用你的 token_helper
+from typing import Dict, List, Optional, Tuple
+from batch_upload import MAX_UNACKED, spotify_chunk_poster, spotify_playlist_length, upload_uris
+from import_journal import ImportJournal
+from playlist_reorder import reorder_playlist
+from token_helper import spotify_delete, spotify_get, spotify_post, token_stats  # 用你的 token_helper
+from uri_check import check_uris
 
 # === 你的設定 ===
 USER_ID = "shxdmnb7i6yvw3fvbsjt7mgdf"
@@ -16,6 +21,10 @@ CSV_GLOB = "playlist_*_with_uri_album_v2.csv"
 
 LOG_FILE = CSV_DIR / "csv2playlist_uri.log"
 
+BATCH_SIZE = 100  # Spotify 一次最多加入 / 移除 100 首
+MARKET = "TW"  # 預檢時檢查能否播放的市場
+CHECK_URIS = True  # 匯入前用 uri_check 批次預檢（--no-check 可關閉）
+
 def log(msg: str):
     now = time.strftime("%Y-%m-%d %H:%M:%S")
     line = f"[{now}] {msg}"
@@ -47,71 +56,230 @@ def create_playlist(name: str, public: bool, desc: str) -> str:
     )
     return resp.json()["id"]
 
-def add_tracks(playlist_id: str, uris: List[str]):
-    total_added = 0
-    for i in range(0, len(uris), 100):  # Spotify 限制一次最多 100 首
-        batch = uris[i:i+100]
-        spotify_post(
-            f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks",
-            json_body={"uris": batch},
-        )
-        total_added += len(batch)
-        time.sleep(0.2)
-    return total_added
+def add_tracks(playlist_id: str, uris: List[str], start_position: Optional[int] = None) -> int:
+    """加到清單最後（或 start_position）；batch_upload 會多批同時送出，順序不變"""
+    if not uris:
+        return 0
+    if start_position is None:
+        start_position = spotify_playlist_length(playlist_id)
+    return upload_uris(spotify_chunk_poster(playlist_id), uris, start_position)
 
-def process_csv(file_path: Path):
-    playlist_name = file_path.stem
-    log(f"=== 開始處理 {file_path.name} → 新建清單: {playlist_name} ===")
-    playlist_id = create_playlist(playlist_name, public=False, desc="Imported by TrackURI")
-    log(f"Playlist ID: {playlist_id}")
-
-    uris, bad_rows = [], []
+def read_uri_rows(file_path: Path, check: bool = CHECK_URIS,
+                  journal: Optional[ImportJournal] = None) -> Tuple[List[str], List[list], int]:
+    """
+    回傳 (可加入的 URI 依 CSV 順序, 無效列依 CSV 順序, 總列數)；check 時先經 uri_check 批次預檢。
+    有 journal 時每列的結果都記進日誌；續傳時已記錄的列沿用日誌的結果、不重新預檢，
+    預檢結果在兩次執行之間改變（例如快取過期）也不會讓已加入的首數對應到不同的曲目。
+    """
+    rows, bad = [], []  # (列號, [Title, Artist, Album, TrackURI])
+    known = journal.resolved if journal else {}
     with file_path.open("r", encoding="utf-8-sig", newline="") as f:
         reader = csv.DictReader(f)
         total = 0
         for row in reader:
             total += 1
             uri = (row.get("TrackURI") or "").strip()
+            fields = [row.get("Title",""), row.get("Artist",""), row.get("Album",""), uri]
+            if not uri.startswith("spotify:track:"):
+                bad.append((total, fields + ["Invalid or missing URI"]))
+            elif total - 1 in known:
+                if known[total - 1] is None:
+                    bad.append((total, fields + ["Not usable when the import started"]))
+            else:
+                rows.append((total, fields))
+
+    # 預檢：無效 / 下架 / 在 MARKET 無法播放的列寫進報表，重新連結的換成可播放的 URI
+    results = check_uris([f[3] for _, f in rows], MARKET) if check and rows else {}
+    checked, relinked = {}, 0  # 列號 → 可加入的 URI（不能加入為 None）
+    for n, fields in rows:
+        res = results.get(fields[3])
+        if res is None:
+            checked[n] = fields[3]
+        elif res.usable:
+            checked[n] = res.uri
+            relinked += res.uri != fields[3]
+        else:
+            checked[n] = None
+            bad.append((n, fields + [res.report_status(MARKET)]))
+        if journal:
+            journal.record_row(n - 1, checked[n])
+    if results:
+        usable = sum(u is not None for u in checked.values())
+        log(f"URI 預檢（{MARKET}）：可加入 {usable}（重新連結 {relinked}），無效或無法播放 {len(rows) - usable}")
+    merged = {**{n + 1: u for n, u in known.items()}, **checked}
+    uris = [merged[n] for n in sorted(merged) if merged[n] is not None]
+    bad.sort(key=lambda x: x[0])
+    return uris, [f for _, f in bad], total
+
+def write_report(file_path: Path, bad_rows: List[list]):
+    """匯出報表（記錄錯誤的）"""
+    if not bad_rows:
+        return
+    report_file = file_path.with_name(f"import_report_{file_path.stem}.csv")
+    with report_file.open("w", encoding="utf-8", newline="") as fo:
+        writer = csv.writer(fo)
+        writer.writerow(["Title", "Artist", "Album", "TrackURI", "Status"])
+        writer.writerows(bad_rows)
+    log(f"⚠️ 有 {len(bad_rows)} 首歌曲的 URI 無效或無法播放，已寫入 {report_file}")
+
+# ====== 同步模式（--sync）======
+
+def fetch_my_playlists() -> Dict[str, str]:
+    """清單名稱 → ID（同名時取第一個）；每次執行只讀一次"""
+    ids: Dict[str, str] = {}
+    url, params = "https://api.spotify.com/v1/me/playlists", {"limit": 50}
+    while url:
+        data = spotify_get(url, params=params).json()
+        for pl in data.get("items", []):
+            if pl and pl.get("name") is not None:
+                ids.setdefault(pl["name"], pl["id"])
+        url, params = data.get("next"), None
+    return ids
+
+def fetch_playlist_uris(playlist_id: str) -> List[str]:
+    """依播放清單順序回傳目前所有曲目 URI（本機檔案、Podcast 單集等非 spotify:track: 的項目略過）"""
+    uris: List[str] = []
+    url = f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks"
+    offset = 0
+    while True:  # 依 offset 翻頁（next 連結不保證帶著 fields）
+        data = spotify_get(url, params={"limit": 100, "offset": offset, "fields": "items(track(uri)),total"}).json()
+        for it in data.get("items", []):
+            uri = ((it or {}).get("track") or {}).get("uri") or ""
             if uri.startswith("spotify:track:"):
                 uris.append(uri)
-            else:
-                bad_rows.append([row.get("Title",""), row.get("Artist",""), row.get("Album",""), uri, "Invalid or missing URI"])
+        offset += 100
+        if offset >= data.get("total", 0):
+            return uris
+
+def diff_uris(current: List[str], wanted: List[str]) -> Tuple[List[str], List[str]]:
+    """集合差：回傳 (要加入的 URI 依 CSV 順序, 要移除的 URI)，各自去除重複"""
+    have, want = set(current), set(wanted)
+    to_add = list(dict.fromkeys(u for u in wanted if u not in have))
+    to_remove = list(dict.fromkeys(u for u in current if u not in want))
+    return to_add, to_remove
+
+def remove_tracks(playlist_id: str, uris: List[str]) -> Optional[str]:
+    """依 URI 移除（清單中同一首的所有出現都會被移除），回傳最後的 snapshot_id"""
+    snapshot = None
+    for i in range(0, len(uris), BATCH_SIZE):
+        batch = uris[i:i+BATCH_SIZE]
+        resp = spotify_delete(
+            f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks",
+            json_body={"tracks": [{"uri": u} for u in batch]},
+        )
+        snapshot = resp.json().get("snapshot_id")
+    return snapshot
+
+def sync_csv(file_path: Path, playlists: Dict[str, str], check: bool = CHECK_URIS):
+    """讓同名播放清單的內容與 CSV 的 TrackURI 一致：只送需要的移除 / 加入批次；沒有同名清單時照一般流程新建"""
+    playlist_name = file_path.stem
+    playlist_id = playlists.get(playlist_name)
+    if playlist_id is None:
+        log(f"找不到名為 {playlist_name} 的播放清單，改為新建")
+        playlists[playlist_name] = process_csv(file_path, check=check)  # 之後的 --reorder 也找得到這個新清單
+        return
+
+    start_ts = time.time()
+    log(f"=== 同步 {file_path.name} → 既有清單: {playlist_name} ({playlist_id}) ===")
+    uris, bad_rows, total = read_uri_rows(file_path, check)
+    current = fetch_playlist_uris(playlist_id)
+    to_add, to_remove = diff_uris(current, uris)
+    log(f"CSV 有效 URI {len(uris)} 首 / 無效 {len(bad_rows)}；清單目前 {len(current)} 首 → 需加入 {len(to_add)}、移除 {len(to_remove)}")
+
+    if to_remove:
+        remove_tracks(playlist_id, to_remove)
+    if to_add:
+        add_tracks(playlist_id, to_add)
+    write_report(file_path, bad_rows)
+    log(f"=== 完成同步 {playlist_name}，總耗時 {format_eta(time.time() - start_ts)} ===")
+
+def reorder_csv(file_path: Path, playlists: Dict[str, str], check: bool = CHECK_URIS):
+    """把同名播放清單的順序調成 CSV 順序（playlist_reorder：只移動最少的曲目）"""
+    playlist_id = playlists.get(file_path.stem)
+    if playlist_id is None:
+        log(f"找不到名為 {file_path.stem} 的既有播放清單，略過排序")
+        return
+    uris, _, _ = read_uri_rows(file_path, check)
+    log(f"=== 依 CSV 順序排列 {file_path.stem} ===")
+    reorder_playlist(playlist_id, uris, log=log)
+
+def process_csv(file_path: Path, resume: bool = False, check: bool = CHECK_URIS) -> str:
+    """新建（或續傳）清單並加入 CSV 的曲目，回傳播放清單 ID"""
+    playlist_name = file_path.stem
+    journal = ImportJournal(file_path, resume=resume)
+    if journal.done:
+        log(f"{file_path.name} 先前已匯入完成，略過（日誌：{journal.path.name}）")
+        journal.close()
+        return journal.playlist_id
+    if journal.resuming:
+        playlist_id = journal.playlist_id
+        log(f"=== 續傳 {file_path.name}：已加入 {journal.added} 首 ===")
+        start = spotify_playlist_length(playlist_id)  # 接在清單目前的最後面
+        surplus = journal.reconcile(start, MAX_UNACKED)
+        if surplus:
+            log(f"清單比日誌多 {surplus} 首（上次已寫入、尚未記錄確認的批次），不再重送")
+    else:
+        if resume and journal.stale:
+            log("⚠️ CSV 在上次匯入後被修改過，無法續傳，重新開始")
+        log(f"=== 開始處理 {file_path.name} → 新建清單: {playlist_name} ===")
+        playlist_id = create_playlist(playlist_name, public=False, desc="Imported by TrackURI")
+        journal.start(playlist_id)
+        journal.record_base(0)
+        start = 0  # 新清單從 0 開始
+    log(f"Playlist ID: {playlist_id}")
+
+    uris, bad_rows, total = read_uri_rows(file_path, check, journal)
 
     # 開始加入
     log(f"共讀取 {total} 首，其中有效 URI {len(uris)}，無效 {len(bad_rows)}")
     start_ts = time.time()
-    added = 0
-    for i in range(0, len(uris), 100):
-        batch = uris[i:i+100]
-        spotify_post(
-            f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks",
-            json_body={"uris": batch},
-        )
-        added += len(batch)
+    already = journal.added  # 續傳時從上次 Spotify 確認的批次之後開始
+    added = already
+
+    def on_ack(acked: int):
+        nonlocal added
+        added = already + acked
+        journal.record_batch(added)
         if added % 200 == 0 or added == len(uris):
             log(progress_line(added, len(uris), added, start_ts))
-        time.sleep(0.2)
 
-    # 匯出報表（記錄錯誤的）
-    if bad_rows:
-        report_file = file_path.with_name(f"import_report_{playlist_name}.csv")
-        with report_file.open("w", encoding="utf-8", newline="") as fo:
-            writer = csv.writer(fo)
-            writer.writerow(["Title", "Artist", "Album", "TrackURI", "Status"])
-            writer.writerows(bad_rows)
-        log(f"⚠️ 有 {len(bad_rows)} 首歌曲的 URI 無效，已寫入 {report_file}")
+    try:
+        upload_uris(spotify_chunk_poster(playlist_id), uris[already:], start, on_ack=on_ack)
+        journal.finish()
+    finally:
+        journal.close()
 
+    write_report(file_path, bad_rows)
     log(f"=== 完成 {playlist_name}，成功加入 {added} 首，總耗時 {format_eta(time.time() - start_ts)} ===")
+    return playlist_id
 
 def main():
-    LOG_FILE.write_text("", encoding="utf-8")
+    ap = argparse.ArgumentParser(description="用 TrackURI 欄位把 CSV 匯入 Spotify 播放清單")
+    ap.add_argument("--resume", action="store_true", help="依 import_journal_<檔名>.jsonl 從上次確認的批次續傳")
+    ap.add_argument("--sync", action="store_true", help="同步到同名的既有播放清單：只加入 / 移除有差異的曲目")
+    ap.add_argument("--reorder", action="store_true", help="把同名的既有播放清單排成 CSV 順序（可與 --sync 一起用）")
+    ap.add_argument("--no-check", action="store_true", help="不做 URI 預檢（只檢查 spotify:track: 開頭）")
+    args = ap.parse_args()
+    check = CHECK_URIS and not args.no_check
+    if (args.sync or args.reorder) and args.resume:
+        ap.error("--sync / --reorder 不能與 --resume 同時使用（兩者本身可重複執行）")
+
+    if not args.resume:
+        LOG_FILE.write_text("", encoding="utf-8")
     csv_files = sorted(CSV_DIR.glob(CSV_GLOB))
     if not csv_files:
         log("❌ 沒找到任何待處理的 CSV")
         return
+    playlists = fetch_my_playlists() if args.sync or args.reorder else {}
     for f in csv_files:
-        process_csv(f)
+        if args.sync:
+            sync_csv(f, playlists, check)
+        if args.reorder:
+            reorder_csv(f, playlists, check)
+        elif not args.sync:
+            process_csv(f, resume=args.resume, check=check)
     log("全部清單處理完成")
+    log(token_stats())
 
 if __name__ == "__main__":
     main()
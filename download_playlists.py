@@ -1,30 +1,119 @@
 # download_playlists.py
 # 作用：列出使用者的所有播放清單，讓使用者選擇要下載哪幾個，然後把每個清單的曲目存成 CSV 檔案
 # 需要先用 spotify_pkce_local.py 取得 tokens.json
-# 需要 token_helper.py 裡的 ensure_access_token 函式
+# 需要 token_helper.py 裡的 spotify_get（含 token 管理與共用速率限制）
 # 會把 CSV 檔案存到目前目錄
 # CSV 格式：Title,Artist,Album,TrackURI
+# 增量匯出：記下每個清單的 snapshot_id（export_state.json），沒變動且 CSV 還在的清單直接略過；
+# 清單列表用 ETag / If-None-Match 條件請求，沒變動時 Spotify 回 304、不必重傳內容
+# 讀取曲目時用 fields 參數只取需要的欄位（歌名 / 歌手 / 專輯名 / URI），結束時列出實際與未過濾時估計的下載量
+# EXPORT_DB = True 時同時寫入 library.db（library_db.py），可跨清單查詢，也能從資料庫重新產生 CSV
+# 每抓到一頁就依序寫進 <檔名>.tmp，完成後才改名成正式檔名；記憶體只保留幾頁，不隨清單大小增加
 # 參考 spotify_pkce_local.py 與 token_helper.py
 # pip install requests
 # python download_playlists.py
-import requests
+import asyncio
 import csv
-import time
-from token_helper import ensure_access_token   # ✅ 改這裡
+from collections import deque
+from contextlib import ExitStack
+import json
+import os
+from pathlib import Path
+from typing import NamedTuple, Tuple
+from urllib.parse import urlencode
+
+from library_db import LibraryDB
+from spotify_async import AsyncSpotify
+from token_helper import spotify_get, token_stats
 
 USER_ID = "shxdmnb7i6yvw3fvbsjt7mgdf"
+ASYNC_DOWNLOAD = True  # True：拿到 total 後同時抓取其餘分頁，多個清單也同時下載
+PAGE_CONCURRENCY = 8   # 非同步下載的同時請求數（所有清單合計）
+PLAYLIST_CONCURRENCY = 4  # 同時下載的清單數
+# 只取 CSV 需要的欄位；不加的話每首會多出 available_markets、圖片、external_ids 等
+TRACK_FIELDS = "items(track(name,uri,artists(name),album(name))),total,next"
+PAYLOAD_SAMPLE = False  # True：結束時多抓兩頁樣本（加 / 不加 fields），估計不加 fields 的下載量
+INCREMENTAL = True     # False：忽略 export_state.json，全部重新下載
+EXPORT_STATE_PATH = Path("export_state.json")
+EXPORT_DB = False      # True：同時寫入 library.db
+
+payload = {"bytes": 0, "pages": 0}  # 這次執行讀取分頁的回應大小（解壓後；304 為 0）
+
+class TrackRecord(NamedTuple):
+    title: str
+    artist: str
+    album: str
+    uri: str
+    artists: Tuple[str, ...] = ()  # 個別歌手名稱（只寫進資料庫，CSV 用 artist）
+
+class ExportState:
+    """
+    上次匯出的狀態：
+      playlists：清單 ID → snapshot_id / 檔名 / 首數
+      pages：清單列表各分頁的 ETag 與內容（304 時沿用）
+    """
+
+    def __init__(self, path=EXPORT_STATE_PATH, enabled=True):
+        self.path = Path(path)
+        self.enabled = enabled
+        self.data = {"playlists": {}, "pages": {}}
+        self.stats = {"not_modified": 0, "skipped": 0}
+        if enabled and self.path.exists():
+            try:
+                self.data.update(json.loads(self.path.read_text(encoding="utf-8")))
+            except (OSError, ValueError):
+                print(f"⚠️ {self.path} 無法讀取，全部重新下載")
+
+    @staticmethod
+    def page_key(url, params):
+        return f"{url}?{urlencode(sorted((params or {}).items()))}"
+
+    def headers(self, key):
+        page = self.data["pages"].get(key) if self.enabled else None
+        return {"If-None-Match": page["etag"]} if page else None
+
+    def page_json(self, key, resp):
+        """304 時回傳上次的內容；否則記下新的 ETag 與內容"""
+        if resp.status_code == 304 and key in self.data["pages"]:
+            self.stats["not_modified"] += 1
+            return self.data["pages"][key]["body"]
+        data = resp.json()
+        etag = resp.headers.get("ETag")
+        if etag:
+            self.data["pages"][key] = {"etag": etag, "body": data}
+        return data
+
+    def unchanged(self, pl, filename, db=None):
+        """snapshot_id 與上次相同、且上次寫的 CSV 還在（有 db 時資料庫裡的也要是同一版）"""
+        prev = self.data["playlists"].get(pl["id"]) if self.enabled else None
+        return bool(prev and pl.get("snapshot_id") and prev["snapshot_id"] == pl["snapshot_id"]
+                    and prev["file"] == filename and os.path.exists(filename)
+                    and (db is None or db.snapshot(pl["id"]) == pl["snapshot_id"]))
+
+    def mark(self, pl, filename, count):
+        if pl.get("snapshot_id"):
+            self.data["playlists"][pl["id"]] = {"snapshot_id": pl["snapshot_id"], "file": filename, "tracks": count}
 
-def get_my_playlists(limit=50):
-    """列出目前使用者的所有播放清單"""
+    def save(self):
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+def count_payload(resp):
+    payload["bytes"] += len(resp.content)
+    payload["pages"] += 1
+    return resp
+
+def get_my_playlists(limit=50, state=None):
+    """列出目前使用者的所有播放清單；有 state 時每頁帶 If-None-Match"""
     playlists = []
     offset = 0
+    url = "https://api.spotify.com/v1/me/playlists"
     while True:
-        token = ensure_access_token()   # ✅ 改這裡
-        resp = requests.get(
-            f"https://api.spotify.com/v1/me/playlists?limit={limit}&offset={offset}",
-            headers={"Authorization": f"Bearer {token}"},
-        )
-        data = resp.json()
+        params = {"limit": limit, "offset": offset}
+        key = ExportState.page_key(url, params)
+        resp = spotify_get(url, params=params, headers=state.headers(key) if state else None)
+        data = state.page_json(key, resp) if state else resp.json()
         if "items" not in data:
             print("❌ 取得播放清單失敗:", data)
             break
@@ -34,46 +123,178 @@ def get_my_playlists(limit=50):
         offset += limit
     return playlists
 
-def get_playlist_tracks(playlist_id):
-    """抓取單一播放清單的所有歌曲"""
-    tracks = []
+def iter_playlist_pages(playlist_id):
+    """逐頁抓取單一播放清單，每次產生一頁的 TrackRecord"""
     limit = 100
     offset = 0
     while True:
-        token = ensure_access_token()   # ✅ 改這裡
-        resp = requests.get(
-            f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks?limit={limit}&offset={offset}",
-            headers={"Authorization": f"Bearer {token}"},
-        )
+        resp = count_payload(spotify_get(
+            f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks",
+            params={"limit": limit, "offset": offset, "fields": TRACK_FIELDS},
+        ))
         data = resp.json()
         if "items" not in data:
-            print("❌ 取得歌單曲目失敗:", data)
-            break
-        for item in data["items"]:
-            track = item.get("track")
-            if not track:
-                continue
-            tracks.append({
-                "Title": track.get("name", ""),
-                "Artist": ", ".join([a["name"] for a in track.get("artists", [])]),
-                "Album": track.get("album", {}).get("name", ""),
-                "TrackURI": track.get("uri", ""),
-            })
+            raise RuntimeError(f"取得歌單曲目失敗: {data}")
+        yield track_rows(data["items"])
         if data.get("next") is None:
             break
         offset += limit
-    return tracks
 
-def save_to_csv(tracks, filename):
-    """把歌曲列表寫到 CSV"""
-    with open(filename, "w", encoding="utf-8-sig", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=["Title", "Artist", "Album", "TrackURI"])
-        writer.writeheader()
-        writer.writerows(tracks)
-    print(f"✅ 已輸出 {len(tracks)} 首歌到 {filename}")
+def open_outputs(stack, pl, filename, db):
+    """CSV 與（有 db 時）資料庫的寫入端；都在 stack 結束時提交或丟棄"""
+    outs = [stack.enter_context(CsvStream(filename))]
+    if db is not None:
+        outs.append(stack.enter_context(db.playlist_writer(pl, os.path.basename(filename))))
+    return outs
+
+def download_playlist(pl, filename, db=None):
+    """邊抓邊寫；回傳首數"""
+    with ExitStack() as stack:
+        outs = open_outputs(stack, pl, filename, db)
+        for page in iter_playlist_pages(pl["id"]):
+            for out in outs:
+                out.write(page)
+    print(f"✅ 已輸出 {outs[0].count} 首歌到 {filename}")
+    return outs[0].count
+
+def track_rows(items):
+    """把 playlist items 轉成 TrackRecord（略過已下架的 null track）"""
+    rows = []
+    for item in items:
+        track = item.get("track")
+        if not track:
+            continue
+        artists = tuple(a["name"] for a in track.get("artists") or [])
+        rows.append(TrackRecord(
+            track.get("name") or "",
+            ", ".join(artists),
+            (track.get("album") or {}).get("name") or "",
+            track.get("uri") or "",
+            artists,
+        ))
+    return rows
+
+async def iter_pages(client, url, limit, params=None, state=None, window=PAGE_CONCURRENCY):
+    """
+    先抓第一頁取得 total，其餘 offset 同時抓取；依 offset 順序逐頁產生 JSON。
+    同時最多先抓 window 頁，消費端處理完一頁才補下一頁，所以記憶體中的頁數固定。
+    有 state（ExportState）時每頁帶 If-None-Match，304 沿用上次的內容。
+    """
+    params = dict(params or {}, limit=limit)
+
+    async def page(offset):
+        p = {**params, "offset": offset}
+        if state is None:
+            return count_payload(await client.get(url, params=p)).json()
+        key = state.page_key(url, p)
+        return state.page_json(key, count_payload(await client.get(url, params=p, headers=state.headers(key))))
+
+    first = await page(0)
+    yield first
+    offsets = iter(range(limit, first.get("total", 0), limit))
+    pending = deque()
+    try:
+        for off in offsets:
+            pending.append(asyncio.ensure_future(page(off)))
+            if len(pending) >= window:
+                break
+        while pending:
+            data = await pending.popleft()
+            off = next(offsets, None)
+            if off is not None:
+                pending.append(asyncio.ensure_future(page(off)))
+            yield data
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def fetch_pages(client, url, limit, params=None, state=None):
+    """iter_pages 的全部結果（清單列表這類小資料用）"""
+    return [data async for data in iter_pages(client, url, limit, params, state)]
+
+async def get_my_playlists_async(client, state=None):
+    pages = await fetch_pages(client, "https://api.spotify.com/v1/me/playlists", 50, state=state)
+    return [pl for page in pages for pl in page.get("items", []) if pl]
+
+async def download_playlist_async(pl, filename, client, db=None):
+    """download_playlist 的非同步版本：分頁同時抓取，依順序邊收邊寫"""
+    url = f"https://api.spotify.com/v1/playlists/{pl['id']}/tracks"
+    with ExitStack() as stack:
+        outs = open_outputs(stack, pl, filename, db)
+        async for page in iter_pages(client, url, 100, {"fields": TRACK_FIELDS}):
+            records = track_rows(page.get("items", []))
+            for out in outs:
+                out.write(records)
+    print(f"✅ 已輸出 {outs[0].count} 首歌到 {filename}")
+    return outs[0].count
+
+async def download_playlists_async(selected, state, db=None):
+    """
+    同時下載多個播放清單：最多 PLAYLIST_CONCURRENCY 個清單、共 PAGE_CONCURRENCY 個請求同時進行，
+    速率由共用 rate limiter 控制。每個清單下載完就寫檔；回傳依 selected 順序的 (清單, 首數)。
+    snapshot_id 沒變的清單略過（首數為 None）。
+    """
+    async with AsyncSpotify(concurrency=PAGE_CONCURRENCY) as client:
+        sem = asyncio.Semaphore(PLAYLIST_CONCURRENCY)
+
+        async def one(pl, filename):
+            if state.unchanged(pl, filename, db):
+                state.stats["skipped"] += 1
+                return pl, None
+            async with sem:
+                print(f"🎵 正在下載: {pl['name']} ...")
+                count = await download_playlist_async(pl, filename, client, db)
+            state.mark(pl, filename, count)
+            return pl, count
+
+        return await asyncio.gather(*(one(pl, fn) for pl, fn in zip(selected, csv_filenames(selected))))
+
+def csv_filenames(selected):
+    """清單名稱 → 檔名；同名清單依順序加上 _2、_3，避免同時下載時互相覆寫"""
+    names, seen = [], {}
+    for pl in selected:
+        base = pl['name'].replace(" ", "_").replace("/", "_")
+        seen[base] = seen.get(base, 0) + 1
+        names.append(f"{base}.csv" if seen[base] == 1 else f"{base}_{seen[base]}.csv")
+    return names
+
+class CsvStream:
+    """
+    依序寫入 CSV：先寫到 <檔名>.tmp，正常結束才 os.replace 成正式檔名；
+    中途出錯時刪掉暫存檔，原本的 CSV（若有）保持不變
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.tmp = f"{filename}.tmp"
+        self.count = 0
+
+    def __enter__(self):
+        self.f = open(self.tmp, "w", encoding="utf-8-sig", newline="")
+        self.writer = csv.writer(self.f)
+        self.writer.writerow(["Title", "Artist", "Album", "TrackURI"])
+        return self
+
+    def write(self, records):
+        self.writer.writerows(r[:4] for r in records)
+        self.count += len(records)
+
+    def __exit__(self, exc_type, exc, tb):
+        self.f.close()
+        if exc_type is None:
+            os.replace(self.tmp, self.filename)
+        else:
+            os.remove(self.tmp)
 
 def main():
-    playlists = get_my_playlists()
+    state = ExportState(enabled=INCREMENTAL)
+    if ASYNC_DOWNLOAD:
+        async def _list():
+            async with AsyncSpotify(concurrency=PAGE_CONCURRENCY) as client:
+                return await get_my_playlists_async(client, state)
+        playlists = asyncio.run(_list())
+    else:
+        playlists = get_my_playlists(state=state)
     if not playlists:
         print("❌ 沒有找到任何播放清單")
         return
@@ -89,17 +310,62 @@ def main():
     else:
         indexes = [int(x.strip()) for x in choice.split(",") if x.strip().isdigit()]
 
+    selected = []
     for idx in indexes:
         if 1 <= idx <= len(playlists):
-            pl = playlists[idx - 1]
-            print(f"\n🎵 正在下載: {pl['name']} ...")
-            tracks = get_playlist_tracks(pl["id"])
-            safe_name = pl['name'].replace(" ", "_").replace("/", "_")
-            filename = f"{safe_name}.csv"
-            save_to_csv(tracks, filename)
-            time.sleep(0.2)
+            selected.append(playlists[idx - 1])
         else:
             print(f"⚠️ 無效的編號: {idx}")
 
+    db = LibraryDB() if EXPORT_DB else None
+    try:
+        downloaded = download_selected(selected, state, db)
+    finally:
+        state.save()  # 中斷時已寫完的清單也記下來
+        if db is not None:
+            print("library.db：" + "、".join(f"{k} {v}" for k, v in db.counts().items()))
+            db.close()
+    print(f"增量匯出：略過未變動清單 {state.stats['skipped']} 個 | 清單列表 304 {state.stats['not_modified']} 頁")
+
+    if selected:
+        # 全部略過時沒有下載過的清單可取樣，只列實際下載量
+        print(payload_report(downloaded[0]["id"] if downloaded else None))
+    print(token_stats())
+
+def download_selected(selected, state, db=None):
+    """下載有變動的清單，回傳實際下載的清單（依 selected 順序）"""
+    downloaded = []
+    if ASYNC_DOWNLOAD:
+        results = asyncio.run(download_playlists_async(selected, state, db))
+        print("\n=== 下載結果 ===")
+        for pl, count in results:
+            print(f"{pl['name']}: " + ("沒有變動，略過" if count is None else f"{count} 首"))
+            if count is not None:
+                downloaded.append(pl)
+    else:
+        for pl, filename in zip(selected, csv_filenames(selected)):
+            if state.unchanged(pl, filename, db):
+                state.stats["skipped"] += 1
+                print(f"⏭️ 沒有變動，略過: {pl['name']}")
+                continue
+            print(f"\n🎵 正在下載: {pl['name']} ...")
+            state.mark(pl, filename, download_playlist(pl, filename, db))
+            downloaded.append(pl)
+    return downloaded
+
+def payload_report(sample_playlist_id=None):
+    """分頁回應的解壓後 JSON 大小（不是網路傳輸量）；PAYLOAD_SAMPLE 且有下載過的清單時，用同一頁加 / 不加 fields 的大小比例估計未過濾的下載量"""
+    kb = payload["bytes"] / 1024
+    line = f"payload: {payload['pages']} 頁，解壓後 JSON {kb:.0f} KB"
+    if not PAYLOAD_SAMPLE or not payload["bytes"] or sample_playlist_id is None:
+        return line
+    url = f"https://api.spotify.com/v1/playlists/{sample_playlist_id}/tracks"
+    slim = len(spotify_get(url, params={"limit": 100, "fields": TRACK_FIELDS}).content)
+    full = len(spotify_get(url, params={"limit": 100}).content)
+    if not slim:
+        return line
+    before = kb * full / slim
+    return line + f"｜不加 fields 估計約 {before:.0f} KB（省 {100 - 100 * kb / before:.0f}%）"
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,58 @@
+# http_client.py
+# 作用：所有腳本共用的 HTTP 連線層
+# - 單一 requests.Session，重複使用 TCP+TLS 連線（keep-alive）
+# - 依主機(host)設定連線池大小，並行請求時不會互相搶連線
+# - 預設要求 gzip 壓縮回應
+# - 統計請求次數與平均延遲(latency)，方便寫進執行日誌比較
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+# 每個主機的連線池大小（pool_maxsize）；並行 worker 數不要超過這裡
+POOL_SIZES = {
+    "https://api.spotify.com/": 16,
+    "https://accounts.spotify.com/": 2,
+    "https://api.genius.com/": 8,
+    "https://genius.com/": 8,
+}
+DEFAULT_POOL_SIZE = 4
+
+DEFAULT_HEADERS = {
+    "Accept-Encoding": "gzip, deflate",
+    "Connection": "keep-alive",
+}
+
+_session = None
+_session_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"requests": 0, "elapsed": 0.0}
+
+def _record(resp, *args, **kwargs):
+    with _stats_lock:
+        _stats["requests"] += 1
+        _stats["elapsed"] += resp.elapsed.total_seconds()
+    return resp
+
+def _build_session() -> requests.Session:
+    s = requests.Session()
+    s.headers.update(DEFAULT_HEADERS)
+    s.mount("https://", HTTPAdapter(pool_connections=len(POOL_SIZES) + 1, pool_maxsize=DEFAULT_POOL_SIZE))
+    for prefix, size in POOL_SIZES.items():
+        s.mount(prefix, HTTPAdapter(pool_connections=1, pool_maxsize=size))
+    s.hooks["response"].append(_record)
+    return s
+
+def get_session() -> requests.Session:
+    """取得全程式共用的 Session（第一次呼叫時建立）。"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+def http_stats() -> str:
+    with _stats_lock:
+        n, total = _stats["requests"], _stats["elapsed"]
+    avg_ms = total / n * 1000 if n else 0.0
+    return f"http: {n} 次請求 | 平均延遲 {avg_ms:.0f} ms"
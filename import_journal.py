@@ -0,0 +1,119 @@
+# import_journal.py
+# 作用：每個輸入 CSV 一份只追加(append-only)的匯入日誌 import_journal_<檔名>.jsonl
+# 記錄：
+#   {"type": "start", "playlist_id": ..., "source_size": ..., "source_mtime": ...}
+#   {"type": "row", "index": 12, "uri": "spotify:track:..." 或 null}   ← 已完成搜尋的列
+#   {"type": "base", "position": 0}                                    ← 第一批加入的位置（清單原有的首數）
+#   {"type": "batch", "added": 300}                                    ← Spotify 已確認加入的累計首數
+#   {"type": "done"}
+# 中斷後用 --resume 重新執行：沿用同一個播放清單、不重搜已搜尋過的列、跳過已確認加入的曲目。
+# 續傳前用 reconcile() 比對清單實際長度與 base + added：多出來的是上次已送出、但還沒記到確認的批次，也一併跳過。
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+def journal_path_for(source: Path) -> Path:
+    return source.with_name(f"import_journal_{source.stem}.jsonl")
+
+class ImportJournal:
+    def __init__(self, source: Path, resume: bool = False):
+        self.source = source
+        self.path = journal_path_for(source)
+        self.playlist_id: Optional[str] = None
+        self.resolved: Dict[int, Optional[str]] = {}
+        self.added = 0
+        self.base: Optional[int] = None
+        self.done = False
+        self.stale = False
+        self._lock = threading.Lock()
+
+        if resume and self.path.exists():
+            self._replay()
+        if not resume or self.stale or self.playlist_id is None:
+            self._reset()
+        self._fh = self.path.open("a", encoding="utf-8")
+
+    def _source_sig(self):
+        st = self.source.stat()
+        return st.st_size, int(st.st_mtime)
+
+    def _replay(self):
+        size, mtime = self._source_sig()
+        with self.path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    break  # 最後一行可能因中斷只寫了一半
+                kind = rec.get("type")
+                if kind == "start":
+                    if (rec.get("source_size"), rec.get("source_mtime")) != (size, mtime):
+                        self.stale = True  # CSV 已被修改，列號對不上，不能續傳
+                        return
+                    self.playlist_id = rec.get("playlist_id")
+                elif kind == "row":
+                    self.resolved[rec["index"]] = rec.get("uri")
+                elif kind == "base":
+                    self.base = rec["position"]
+                elif kind == "batch":
+                    self.added = max(self.added, rec["added"])
+                elif kind == "done":
+                    self.done = True
+
+    def _reset(self):
+        self.playlist_id = None
+        self.resolved = {}
+        self.added = 0
+        self.base = None
+        self.done = False
+        self.path.write_text("", encoding="utf-8")
+
+    @property
+    def resuming(self) -> bool:
+        return self.playlist_id is not None
+
+    def _write(self, rec: dict, sync: bool = False):
+        with self._lock:
+            self._fh.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            self._fh.flush()
+            if sync:
+                os.fsync(self._fh.fileno())
+
+    def start(self, playlist_id: str):
+        size, mtime = self._source_sig()
+        self.playlist_id = playlist_id
+        self._write({"type": "start", "playlist_id": playlist_id, "source_size": size,
+                     "source_mtime": mtime, "ts": time.time()}, sync=True)
+
+    def record_row(self, index: int, uri: Optional[str]):
+        self._write({"type": "row", "index": index, "uri": uri})
+
+    def record_base(self, position: int):
+        self.base = position
+        self._write({"type": "base", "position": position}, sync=True)
+
+    def record_batch(self, added_total: int):
+        self.added = added_total
+        self._write({"type": "batch", "added": added_total}, sync=True)
+
+    def reconcile(self, playlist_length: int, max_surplus: int) -> int:
+        """
+        續傳時比對清單實際長度與日誌預期的長度（base + added；沒有 base 記錄時當作 0）。
+        多出 1 ~ max_surplus 首時，視為上次已送出但沒記到確認的批次，記成已加入並回傳多出的首數；
+        其他情況（清單被手動修改過）不調整，回傳 0。
+        """
+        surplus = playlist_length - ((self.base or 0) + self.added)
+        if not 0 < surplus <= max_surplus:
+            return 0
+        self.record_batch(self.added + surplus)
+        return surplus
+
+    def finish(self):
+        self.done = True
+        self._write({"type": "done", "ts": time.time()}, sync=True)
+
+    def close(self):
+        self._fh.close()
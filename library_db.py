@@ -0,0 +1,205 @@
+# library_db.py
+# 作用：把下載的播放清單存進 SQLite（library.db），可以直接查詢「哪些清單有這首歌」、「某歌手的所有歌」
+# - 資料表：playlists、tracks、artists、track_artists（曲目 ↔ 歌手）、playlist_tracks（清單 ↔ 曲目，含順序）
+# - 每次匯出以 upsert 更新曲目與歌手；清單內容先寫到暫存的成員列，整份下載完成才一次換掉舊的
+# - 原本的 Title,Artist,Album,TrackURI CSV 可以隨時從資料庫重新產生
+#
+# download_playlists.py 設 EXPORT_DB = True 時會同時寫入這裡。
+#
+# 用法：
+#   python library_db.py stats                       # 各資料表筆數
+#   python library_db.py where spotify:track:xxxx    # 哪些清單有這首歌（也可用歌名）
+#   python library_db.py artist "周杰倫"              # 這位歌手在各清單裡的歌
+#   python library_db.py csv [清單名稱或 ID ...] [--out 目錄]   # 重新產生 CSV（不指定則全部）
+import argparse
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence
+
+LIBRARY_DB_PATH = Path("library.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS playlists (
+    id TEXT PRIMARY KEY, name TEXT, snapshot_id TEXT, track_count INTEGER, csv_file TEXT, exported REAL);
+CREATE TABLE IF NOT EXISTS tracks (
+    uri TEXT PRIMARY KEY, title TEXT, artist TEXT, album TEXT);
+CREATE TABLE IF NOT EXISTS artists (
+    id INTEGER PRIMARY KEY, name TEXT UNIQUE);
+CREATE TABLE IF NOT EXISTS track_artists (
+    track_uri TEXT, position INTEGER, artist_id INTEGER, PRIMARY KEY (track_uri, position));
+CREATE TABLE IF NOT EXISTS playlist_tracks (
+    playlist_id TEXT, position INTEGER, track_uri TEXT, PRIMARY KEY (playlist_id, position));
+CREATE INDEX IF NOT EXISTS idx_playlist_tracks_uri ON playlist_tracks (track_uri);
+CREATE INDEX IF NOT EXISTS idx_track_artists_artist ON track_artists (artist_id);
+CREATE INDEX IF NOT EXISTS idx_tracks_title ON tracks (title);
+CREATE INDEX IF NOT EXISTS idx_playlists_name ON playlists (name);
+"""
+
+STAGING_SUFFIX = "#staging"  # 下載中的清單成員先寫在 <清單 ID>#staging
+
+class LibraryDB:
+    def __init__(self, db_path: Path = LIBRARY_DB_PATH):
+        self.conn = sqlite3.connect(str(db_path), timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def snapshot(self, playlist_id: str) -> Optional[str]:
+        row = self.conn.execute("SELECT snapshot_id FROM playlists WHERE id=?", (playlist_id,)).fetchone()
+        return row[0] if row else None
+
+    def playlist_writer(self, pl: dict, csv_file: str = "") -> "PlaylistWriter":
+        return PlaylistWriter(self, pl, csv_file)
+
+    def upsert_tracks(self, records: Sequence):
+        """records：download_playlists.TrackRecord（含 artists 清單）；沒有 URI 的略過"""
+        records = [r for r in records if r.uri]
+        if not records:
+            return
+        c = self.conn
+        names = {a for r in records for a in r.artists}
+        c.executemany("INSERT OR IGNORE INTO artists (name) VALUES (?)", [(a,) for a in names])
+        ids = {}
+        names = list(names)
+        for i in range(0, len(names), 500):  # SQLite 參數數量上限
+            part = names[i:i + 500]
+            ids.update(c.execute(f"SELECT name, id FROM artists WHERE name IN ({','.join('?' * len(part))})", part))
+        c.executemany(
+            "INSERT INTO tracks (uri, title, artist, album) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT(uri) DO UPDATE SET title=excluded.title, artist=excluded.artist, album=excluded.album",
+            [(r.uri, r.title, r.artist, r.album) for r in records],
+        )
+        c.executemany("DELETE FROM track_artists WHERE track_uri=?", [(r.uri,) for r in records])
+        c.executemany(
+            "INSERT OR REPLACE INTO track_artists VALUES (?, ?, ?)",
+            [(r.uri, i, ids[a]) for r in records for i, a in enumerate(r.artists)],
+        )
+
+    # ---- 查詢 ----
+
+    def playlist_rows(self, playlist_id: str) -> Iterable[tuple]:
+        """依清單順序回傳 (Title, Artist, Album, TrackURI)"""
+        return self.conn.execute(
+            "SELECT t.title, t.artist, t.album, t.uri FROM playlist_tracks pt"
+            " JOIN tracks t ON t.uri = pt.track_uri WHERE pt.playlist_id=? ORDER BY pt.position",
+            (playlist_id,),
+        )
+
+    def playlists_with(self, uri_or_title: str) -> List[tuple]:
+        """(清單名稱, 位置, 歌名, URI)；位置從 1 開始"""
+        return self.conn.execute(
+            "SELECT p.name, pt.position + 1, t.title, t.uri FROM tracks t"
+            " JOIN playlist_tracks pt ON pt.track_uri = t.uri JOIN playlists p ON p.id = pt.playlist_id"
+            " WHERE t.uri=? OR t.title=? ORDER BY p.name, pt.position",
+            (uri_or_title, uri_or_title),
+        ).fetchall()
+
+    def tracks_by_artist(self, name: str) -> List[tuple]:
+        """(歌名, 專輯, URI, 清單名稱)"""
+        return self.conn.execute(
+            "SELECT t.title, t.album, t.uri, p.name FROM artists a"
+            " JOIN track_artists ta ON ta.artist_id = a.id JOIN tracks t ON t.uri = ta.track_uri"
+            " JOIN playlist_tracks pt ON pt.track_uri = t.uri JOIN playlists p ON p.id = pt.playlist_id"
+            " WHERE a.name=? ORDER BY t.title, p.name",
+            (name,),
+        ).fetchall()
+
+    def find_playlists(self, keys: Sequence[str]) -> List[tuple]:
+        """依名稱或 ID 找清單（不指定則全部）；回傳 (id, name, csv_file)，依名稱排序"""
+        rows = self.conn.execute("SELECT id, name, csv_file FROM playlists ORDER BY name, id").fetchall()
+        if not keys:
+            return rows
+        return [r for r in rows if r[0] in keys or r[1] in keys]
+
+    def counts(self) -> dict:
+        return {t: self.conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+                for t in ("playlists", "tracks", "artists", "playlist_tracks")}
+
+class PlaylistWriter:
+    """
+    與 download_playlists.CsvStream 相同的介面（write / count），逐頁寫入一個清單。
+    成員列先寫到暫存 ID，每頁各自提交（多個清單同時下載也不會互相影響）；
+    正常結束才一次換掉舊的成員列並記下 snapshot_id，出錯則丟棄暫存列。
+    """
+
+    def __init__(self, db: LibraryDB, pl: dict, csv_file: str = ""):
+        self.db = db
+        self.pl = pl
+        self.csv_file = csv_file
+        self.staging = pl["id"] + STAGING_SUFFIX
+        self.count = 0
+
+    def __enter__(self):
+        self.db.conn.execute("DELETE FROM playlist_tracks WHERE playlist_id=?", (self.staging,))
+        return self
+
+    def write(self, records: Sequence):
+        c = self.db.conn
+        c.execute("BEGIN")
+        self.db.upsert_tracks(records)
+        c.executemany(
+            "INSERT INTO playlist_tracks VALUES (?, ?, ?)",
+            [(self.staging, self.count + i, r.uri) for i, r in enumerate(records) if r.uri],
+        )
+        c.execute("COMMIT")
+        self.count += len(records)
+
+    def __exit__(self, exc_type, exc, tb):
+        c = self.db.conn
+        if c.in_transaction:
+            c.execute("ROLLBACK")
+        c.execute("BEGIN")
+        if exc_type is None:
+            pl = self.pl
+            c.execute("DELETE FROM playlist_tracks WHERE playlist_id=?", (pl["id"],))
+            c.execute("UPDATE playlist_tracks SET playlist_id=? WHERE playlist_id=?", (pl["id"], self.staging))
+            c.execute(
+                "INSERT OR REPLACE INTO playlists VALUES (?, ?, ?, ?, ?, ?)",
+                (pl["id"], pl["name"], pl.get("snapshot_id"), self.count, self.csv_file, time.time()),
+            )
+        else:
+            c.execute("DELETE FROM playlist_tracks WHERE playlist_id=?", (self.staging,))
+        c.execute("COMMIT")
+
+def export_csv(db: LibraryDB, keys: Sequence[str], out_dir: Path) -> int:
+    """從資料庫重新產生 CSV，沿用下載時的檔名（沒有記錄時依 download_playlists 的規則命名）；回傳檔案數"""
+    from download_playlists import CsvStream, csv_filenames
+
+    rows = db.find_playlists(keys)
+    playlists = [{"id": pid, "name": name} for pid, name, _ in rows]
+    names = [stored or default for (_, _, stored), default in zip(rows, csv_filenames(playlists))]
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for pl, filename in zip(playlists, names):
+        with CsvStream(str(out_dir / filename)) as out:
+            out.write(list(db.playlist_rows(pl["id"])))
+        print(f"✅ {pl['name']}: {out.count} 首 → {out_dir / filename}")
+    return len(playlists)
+
+def main():
+    ap = argparse.ArgumentParser(description="查詢本機歌單資料庫，或從資料庫重新產生 CSV")
+    ap.add_argument("command", choices=["stats", "where", "artist", "csv"])
+    ap.add_argument("args", nargs="*", help="where：URI 或歌名；artist：歌手名稱；csv：清單名稱或 ID（可多個）")
+    ap.add_argument("--db", default=str(LIBRARY_DB_PATH), help="資料庫路徑")
+    ap.add_argument("--out", default=".", help="csv 的輸出目錄")
+    a = ap.parse_args()
+
+    db = LibraryDB(Path(a.db))
+    if a.command == "stats":
+        for table, n in db.counts().items():
+            print(f"{table}: {n}")
+    elif a.command == "where":
+        for name, pos, title, uri in db.playlists_with(" ".join(a.args)):
+            print(f"{name} #{pos}: {title} ({uri})")
+    elif a.command == "artist":
+        for title, album, uri, name in db.tracks_by_artist(" ".join(a.args)):
+            print(f"{title} | {album} | {uri} | {name}")
+    else:
+        export_csv(db, a.args, Path(a.out))
+    db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+# lyrics_cache.py
+# 作用：classify_pick_and_merge 的歌詞快取，存在 SQLite（lyrics_cache.db），取代一次讀寫整份的 lyrics_cache.json
+# - 每首歌抓完就寫入（中途當掉也不會遺失），啟動時不必載入整個檔案
+# - 每筆同時記下語言判斷結果(verdict)；STORE_LYRICS = False 時只存判斷結果，不存歌詞全文
+# - 歌詞以 zlib 壓縮（COMPRESS）
+# - 超過 MAX_ENTRIES 筆或歌詞總量超過 MAX_MB 時，依最後使用時間(LRU)淘汰最舊的
+# - 第一次使用時自動匯入舊的 lyrics_cache.json，之後把它改名為 lyrics_cache.json.migrated
+#
+# 用法：
+#   python lyrics_cache.py stats
+#   python lyrics_cache.py prune --max-entries 20000 --max-mb 50
+#   python lyrics_cache.py prune --drop-lyrics      # 只保留判斷結果，刪掉所有歌詞全文
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+LYRICS_DB_PATH = Path("lyrics_cache.db")
+STORE_LYRICS = True   # False：只存語言判斷結果
+COMPRESS = True
+COMPRESS_LEVEL = 6
+MAX_ENTRIES = 50_000
+MAX_MB = 100          # 歌詞（壓縮後）總量上限
+
+class LyricsCache:
+    def __init__(self, db_path: Path = LYRICS_DB_PATH, store_lyrics: bool = STORE_LYRICS,
+                 compress: bool = COMPRESS):
+        self.db_path = db_path
+        self.store_lyrics = store_lyrics
+        self.compress = compress
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0}
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS lyrics ("
+            " key TEXT PRIMARY KEY, verdict TEXT, body BLOB, compressed INTEGER, size INTEGER,"
+            " created REAL, last_used REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_lyrics_last_used ON lyrics (last_used)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def __contains__(self, key: str) -> bool:
+        return self._conn().execute("SELECT 1 FROM lyrics WHERE key=?", (key,)).fetchone() is not None
+
+    def get(self, key: str) -> Tuple[bool, Optional[str]]:
+        """回傳 (是否命中, 語言判斷)；命中但判斷為 None 表示沒有歌詞或判斷不出來"""
+        row = self._conn().execute("SELECT verdict FROM lyrics WHERE key=?", (key,)).fetchone()
+        if row is None:
+            self._count("misses")
+            return False, None
+        self._conn().execute("UPDATE lyrics SET last_used=? WHERE key=?", (time.time(), key))
+        self._count("hits")
+        return True, row[0]
+
+    def get_lyrics(self, key: str) -> Optional[str]:
+        """歌詞全文；沒存（只存判斷結果或沒有這筆）時回傳 None"""
+        row = self._conn().execute("SELECT body, compressed FROM lyrics WHERE key=?", (key,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        body, compressed = row
+        return (zlib.decompress(body) if compressed else body).decode("utf-8")
+
+    def _encode(self, lyrics: str) -> Tuple[Optional[bytes], int]:
+        if not self.store_lyrics or not lyrics:
+            return None, 0
+        raw = lyrics.encode("utf-8")
+        return (zlib.compress(raw, COMPRESS_LEVEL), 1) if self.compress else (raw, 0)
+
+    def put(self, key: str, lyrics: str, verdict: Optional[str]):
+        now = time.time()
+        body, compressed = self._encode(lyrics)
+        self._conn().execute(
+            "INSERT OR REPLACE INTO lyrics VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, verdict, body, compressed, len(body or b""), now, now),
+        )
+        self._count("stores")
+
+    def migrate_json(self, json_path: Path, verdict_of: Callable[[str], Optional[str]]) -> int:
+        """匯入舊版 {key: 歌詞} JSON（已存在的 key 不覆蓋），完成後把 JSON 改名；回傳匯入筆數"""
+        if not json_path.exists():
+            return 0
+        try:
+            data = json.loads(json_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 無法匯入 {json_path}：{e}")
+            return 0
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN")
+        rows = []
+        for key, lyrics in data.items():
+            lyrics = lyrics if isinstance(lyrics, str) else ""
+            body, compressed = self._encode(lyrics)
+            rows.append((key, verdict_of(lyrics) if lyrics else None, body, compressed, len(body or b""), now, now))
+        conn.executemany("INSERT OR IGNORE INTO lyrics VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.execute("COMMIT")
+        os.replace(json_path, json_path.with_name(json_path.name + ".migrated"))
+        print(f"✅ 已把 {json_path}（{len(rows)} 筆）匯入 {self.db_path}")
+        return len(rows)
+
+    def prune(self, max_entries: int = MAX_ENTRIES, max_mb: float = MAX_MB, drop_lyrics: bool = False) -> int:
+        """依 LRU 把筆數壓到 max_entries、歌詞總量壓到 max_mb 以下；回傳刪除筆數"""
+        conn = self._conn()
+        if drop_lyrics:
+            conn.execute("UPDATE lyrics SET body=NULL, compressed=0, size=0 WHERE body IS NOT NULL")
+        before = conn.execute("SELECT COUNT(*) FROM lyrics").fetchone()[0]
+        conn.execute(
+            "DELETE FROM lyrics WHERE rowid IN ("
+            " SELECT rowid FROM lyrics ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (max_entries,),
+        )
+        conn.execute(
+            "DELETE FROM lyrics WHERE rowid IN ("
+            " SELECT rowid FROM (SELECT rowid, SUM(size) OVER (ORDER BY last_used DESC, rowid DESC) AS total"
+            " FROM lyrics) WHERE total > ?)",
+            (int(max_mb * 1024 * 1024),),
+        )
+        after = conn.execute("SELECT COUNT(*) FROM lyrics").fetchone()[0]
+        if drop_lyrics or after < before:
+            conn.execute("VACUUM")
+        return before - after
+
+    def table_stats(self) -> dict:
+        conn = self._conn()
+        entries, with_lyrics, lyric_bytes = conn.execute(
+            "SELECT COUNT(*), COUNT(body), COALESCE(SUM(size), 0) FROM lyrics"
+        ).fetchone()
+        size = self.db_path.stat().st_size if self.db_path.exists() else 0
+        return {"entries": entries, "with_lyrics": with_lyrics, "lyric_bytes": lyric_bytes, "bytes": size}
+
+    def summary(self) -> str:
+        s = self.stats
+        return f"lyrics cache: 命中 {s['hits']} | 未命中 {s['misses']} | 寫入 {s['stores']}"
+
+def main():
+    ap = argparse.ArgumentParser(description="查看或清理歌詞快取（lyrics_cache.db）")
+    ap.add_argument("command", choices=["stats", "prune"])
+    ap.add_argument("--db", default=str(LYRICS_DB_PATH), help="快取資料庫路徑")
+    ap.add_argument("--max-entries", type=int, default=MAX_ENTRIES, help="最多保留幾筆（LRU）")
+    ap.add_argument("--max-mb", type=float, default=MAX_MB, help="歌詞（壓縮後）總量上限 MB")
+    ap.add_argument("--drop-lyrics", action="store_true", help="prune：刪掉所有歌詞全文，只保留判斷結果")
+    args = ap.parse_args()
+
+    cache = LyricsCache(Path(args.db))
+    if args.command == "prune":
+        removed = cache.prune(args.max_entries, args.max_mb, drop_lyrics=args.drop_lyrics)
+        print(f"已刪除 {removed} 筆")
+    st = cache.table_stats()
+    print(f"共 {st['entries']} 筆（含歌詞全文 {st['with_lyrics']} 筆，{st['lyric_bytes'] / 1024:.0f} KB）"
+          f" | 檔案大小 {st['bytes'] / 1024:.0f} KB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+# playlist_reorder.py
+# 作用：把既有播放清單的順序調整成與 CSV 的 TrackURI 順序一致，只移動最少的曲目
+# - 以「目前順序中已經排好的最長遞增子序列(LIS)」為基準，這些曲目不動，其餘逐一插到正確位置
+# - 相鄰且要一起移動的曲目合併成一次 range 移動
+# - 透過 PUT /v1/playlists/{id}/tracks（range_start / insert_before / snapshot_id）套用
+# - CSV 裡沒有的曲目（含本機檔案）保持相對順序，排在最後
+#
+# 用法：
+#   python playlist_reorder.py <playlist_id> <csv 檔>            # 實際調整
+#   python playlist_reorder.py <playlist_id> <csv 檔> --dry-run  # 只顯示需要幾次移動
+# csv2playlist_uri.py 的 --reorder 也會呼叫這裡的 reorder_playlist()。
+import argparse
+import csv
+from bisect import bisect_left, insort
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from token_helper import spotify_get, spotify_put, token_stats
+
+class Move(NamedTuple):
+    range_start: int
+    range_length: int
+    insert_before: int
+
+def fetch_playlist_items(playlist_id: str) -> Tuple[List[Optional[str]], str]:
+    """依目前順序回傳每個項目的 URI（沒有 URI 的項目為 None，保留位置）以及 snapshot_id"""
+    base = f"https://api.spotify.com/v1/playlists/{playlist_id}"
+    snapshot = spotify_get(base, params={"fields": "snapshot_id"}).json()["snapshot_id"]
+    items: List[Optional[str]] = []
+    offset = 0
+    while True:  # 依 offset 翻頁（next 連結不保證帶著 fields）
+        data = spotify_get(f"{base}/tracks", params={"limit": 100, "offset": offset,
+                                                     "fields": "items(track(uri)),total"}).json()
+        for it in data.get("items", []):
+            items.append(((it or {}).get("track") or {}).get("uri"))
+        offset += 100
+        if offset >= data.get("total", 0):
+            return items, snapshot
+
+def target_ranks(current: List[Optional[str]], wanted: List[str]) -> List[int]:
+    """每個目前項目在目標順序中的名次；同一首重複出現時依序對應，CSV 沒有的排在最後並保持原順序"""
+    slots: Dict[str, Deque[int]] = defaultdict(deque)
+    for i, uri in enumerate(wanted):
+        slots[uri].append(i)
+    ranks, extra = [], len(wanted)
+    for uri in current:
+        if uri is not None and slots.get(uri):
+            ranks.append(slots[uri].popleft())
+        else:
+            ranks.append(extra)
+            extra += 1
+    return ranks
+
+def longest_increasing(ranks: List[int]) -> List[int]:
+    """回傳最長遞增子序列的名次（O(n log n)）"""
+    tails: List[int] = []      # tails[k]：長度 k+1 的遞增子序列的最小結尾位置
+    prev = [-1] * len(ranks)
+    for i, r in enumerate(ranks):
+        k = _bisect_tails(ranks, tails, r)
+        if k > 0:
+            prev[i] = tails[k - 1]
+        if k == len(tails):
+            tails.append(i)
+        else:
+            tails[k] = i
+    out, i = [], tails[-1] if tails else -1
+    while i != -1:
+        out.append(ranks[i])
+        i = prev[i]
+    return out[::-1]
+
+def _bisect_tails(ranks: List[int], tails: List[int], r: int) -> int:
+    lo, hi = 0, len(tails)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if ranks[tails[mid]] < r:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+class _Fenwick:
+    """前綴和（Fenwick tree）：記錄哪些槽位有曲目，用來查某個槽位前面有幾首"""
+
+    def __init__(self, size: int):
+        self.tree = [0] * (size + 1)
+
+    def add(self, i: int, delta: int):
+        i += 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def before(self, i: int) -> int:
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+def _slot_order(ranks: List[int], placed: List[int], pending: List[int]) -> Tuple[Dict[int, int], Dict[int, int]]:
+    """
+    每首歌原本的槽位與移動後的新槽位在最終清單中的先後（rank → 排序位置）。
+    待移動的曲目依名次插在「已就位且名次比它小的最後一個項目」之後，所以新槽位一定緊接在那個項目的槽位後面，
+    而且每個槽位後面最多只會接一個新槽位；照原本順序走過每個槽位與後面接上的新槽位，就是所有槽位的先後。
+    """
+    n = len(ranks)
+    first = {r: i for i, r in enumerate(ranks)}
+    new: Dict[int, int] = {}
+    follow: Dict[int, int] = {}   # 槽位 → 緊接在後面的新槽位
+    head: Optional[int] = None   # 插到最前面的新槽位
+    placed = list(placed)
+    for r in pending:
+        k = bisect_left(placed, r)
+        slot = new[r] = n + len(new)
+        if k > 0:
+            pred = placed[k - 1]
+            follow[new.get(pred, first[pred])] = slot
+        else:
+            head = slot
+        insort(placed, r)
+
+    order = [0] * (n + len(new))
+    idx = 0
+    for slot in [head] + list(range(n)):
+        while slot is not None:
+            order[slot] = idx
+            idx += 1
+            slot = follow.get(slot)
+    return ({r: order[i] for r, i in first.items()}, {r: order[i] for r, i in new.items()})
+
+def plan_moves(ranks: List[int]) -> List[Move]:
+    """
+    計算把 ranks 排成遞增所需的移動（依序套用）。
+    LIS 內的項目不動；其餘依名次由小到大，插到「已就位且名次比它小的最後一個項目」之後。
+    名次連續、位置也相鄰的待移動項目合併成一次移動。
+    目前位置由槽位的前綴和查出（O(log n)），不必每次在整份清單裡搜尋。
+    """
+    placed = longest_increasing(ranks)  # 已就位的名次（遞增）
+    stay = set(placed)
+    pending = sorted(r for r in ranks if r not in stay)
+    first, new = _slot_order(ranks, placed, pending)
+    slots = _Fenwick(len(first) + len(new))
+    for o in first.values():
+        slots.add(o, 1)
+    where = dict(first)   # rank → 目前槽位的排序位置
+
+    def pos(r: int) -> int:
+        return slots.before(where[r])
+
+    moves: List[Move] = []
+    i = 0
+    while i < len(pending):
+        r = pending[i]
+        start = pos(r)
+        length = 1
+        while (i + length < len(pending) and pending[i + length] == r + length
+               and pos(r + length) == start + length):
+            length += 1
+        k = bisect_left(placed, r)
+        insert_before = pos(placed[k - 1]) + 1 if k > 0 else 0
+        if insert_before != start and insert_before != start + length:
+            moves.append(Move(start, length, insert_before))
+        for x in range(r, r + length):
+            slots.add(where[x], -1)
+            where[x] = new[x]
+            slots.add(where[x], 1)
+            insort(placed, x)
+        i += length
+    return moves
+
+def reorder_playlist(playlist_id: str, wanted: List[str], dry_run: bool = False,
+                     log: Callable[[str], None] = print) -> int:
+    """把播放清單順序調成 wanted（URI 清單）；回傳實際（或 dry_run 時預計）的移動次數"""
+    items, snapshot = fetch_playlist_items(playlist_id)
+    moves = plan_moves(target_ranks(items, wanted))
+    log(f"清單 {playlist_id}：{len(items)} 首，需要 {len(moves)} 次移動")
+    if dry_run:
+        return len(moves)
+    url = f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks"
+    for n, mv in enumerate(moves, 1):
+        resp = spotify_put(url, json_body={
+            "range_start": mv.range_start,
+            "range_length": mv.range_length,
+            "insert_before": mv.insert_before,
+            "snapshot_id": snapshot,
+        })
+        snapshot = resp.json().get("snapshot_id", snapshot)
+        if n % 20 == 0 or n == len(moves):
+            log(f"已移動 {n}/{len(moves)}")
+    return len(moves)
+
+def read_csv_uris(file_path: Path) -> List[str]:
+    with file_path.open("r", encoding="utf-8-sig", newline="") as f:
+        return [u for u in ((row.get("TrackURI") or "").strip() for row in csv.DictReader(f))
+                if u.startswith("spotify:track:")]
+
+def main():
+    ap = argparse.ArgumentParser(description="依 CSV 的 TrackURI 順序，以最少移動次數重新排列播放清單")
+    ap.add_argument("playlist_id", help="要調整的播放清單 ID")
+    ap.add_argument("csv", help="含 TrackURI 欄位的 CSV（目標順序）")
+    ap.add_argument("--dry-run", action="store_true", help="只計算需要的移動次數，不修改清單")
+    args = ap.parse_args()
+
+    reorder_playlist(args.playlist_id, read_csv_uris(Path(args.csv)), dry_run=args.dry_run)
+    print(token_stats())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+# rate_limiter.py
+# 作用：所有 Spotify 請求共用的自適應 token bucket 速率限制器(rate limiter)
+# - 每個請求前先 acquire() 取一個 token；沒有 token 就等到補滿為止
+# - 收到 429：速率減半（乘法遞減），並依 Retry-After 讓所有請求一起暫停；
+#   同一段暫停期間內（其他已送出的請求接著回 429）只減半一次
+# - 連續成功 RAMP_UP_AFTER 次：速率 +RAMP_UP_STEP（加法遞增），最多到 MAX_RATE
+# - 狀態存在 SQLite 檔（rate_limit.db），同一台電腦上的多個執行緒/行程共用同一份額度
+# - 成功次數先在行程內累計，每 SUCCESS_FLUSH 次才寫回一次，一般請求只需要 acquire 這一次寫入
+# - asyncio 版（acquire_async / on_success_async / on_rate_limited_async）把 SQLite 交易放到執行緒執行，
+#   等待檔案鎖時不會卡住 event loop
+#
+# 用法：
+#   limiter = get_limiter()            # 預設 bucket 名稱 "spotify"
+#   limiter.acquire()
+#   resp = session.get(...)
+#   if resp.status_code == 429: limiter.on_rate_limited(retry_after)
+#   else: limiter.on_success()
+import asyncio
+import sqlite3
+import threading
+import time
+from functools import partial
+from pathlib import Path
+from typing import Dict
+
+RATE_DB_PATH = Path("rate_limit.db")
+
+INITIAL_RATE = 5.0     # 每秒請求數（起始）
+MIN_RATE = 0.5
+MAX_RATE = 20.0
+BURST = 10.0           # bucket 容量：閒置後最多可連發幾個
+RAMP_UP_AFTER = 50     # 連續成功幾次後提高速率
+RAMP_UP_STEP = 1.0
+BACKOFF_FACTOR = 0.5
+SUCCESS_FLUSH = 10     # 累計幾次成功才寫回資料庫
+
+class AdaptiveRateLimiter:
+    def __init__(self, name: str = "spotify", db_path: Path = RATE_DB_PATH,
+                 initial_rate: float = INITIAL_RATE, min_rate: float = MIN_RATE,
+                 max_rate: float = MAX_RATE, burst: float = BURST):
+        self.name = name
+        self.db_path = db_path
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self._local = threading.local()
+        self.stats = {"acquired": 0, "waited_sec": 0.0, "rate_limited": 0}
+        self._pending_lock = threading.Lock()
+        self._pending_success = 0   # 尚未寫回的成功次數
+        self._init_db()
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 連線不能跨執行緒共用，每個執行緒各開一條
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            " name TEXT PRIMARY KEY, tokens REAL, updated REAL, rate REAL,"
+            " streak INTEGER, cooldown_until REAL, last_backoff REAL DEFAULT 0)"
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(buckets)")}
+        if "last_backoff" not in columns:  # 舊版 rate_limit.db
+            conn.execute("ALTER TABLE buckets ADD COLUMN last_backoff REAL DEFAULT 0")
+        conn.execute(
+            "INSERT OR IGNORE INTO buckets VALUES (?, ?, ?, ?, 0, 0, 0)",
+            (self.name, self.burst, time.time(), self.initial_rate),
+        )
+        # 舊紀錄可能是用別的上下限建立的，先夾回目前的範圍
+        conn.execute(
+            "UPDATE buckets SET rate = MIN(MAX(rate, ?), ?) WHERE name = ?",
+            (self.min_rate, self.max_rate, self.name),
+        )
+
+    FIELDS = ("tokens", "updated", "rate", "streak", "cooldown_until", "last_backoff")
+
+    def _update(self, fn):
+        """在 BEGIN IMMEDIATE 交易中讀取並改寫 bucket，確保跨行程互斥"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                f"SELECT {', '.join(self.FIELDS)} FROM buckets WHERE name = ?", (self.name,),
+            ).fetchone()
+            state = dict(zip(self.FIELDS, row))
+            result = fn(state, time.time())
+            conn.execute(
+                f"UPDATE buckets SET {', '.join(f + ' = ?' for f in self.FIELDS)} WHERE name = ?",
+                (*(state[f] for f in self.FIELDS), self.name),
+            )
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _try_acquire(self) -> float:
+        """取得 token 回傳 0，否則回傳建議等待秒數"""
+        def fn(s, now):
+            if now < s["cooldown_until"]:
+                return s["cooldown_until"] - now
+            s["tokens"] = min(self.burst, s["tokens"] + (now - s["updated"]) * s["rate"])
+            s["updated"] = now
+            if s["tokens"] >= 1:
+                s["tokens"] -= 1
+                return 0.0
+            return (1 - s["tokens"]) / s["rate"]
+        return self._update(fn)
+
+    def acquire(self):
+        while True:
+            wait = self._try_acquire()
+            if wait <= 0:
+                self.stats["acquired"] += 1
+                return
+            self.stats["waited_sec"] += wait
+            time.sleep(wait)
+
+    @staticmethod
+    async def _in_thread(fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, partial(fn, *args))
+
+    async def acquire_async(self):
+        while True:
+            wait = await self._in_thread(self._try_acquire)
+            if wait <= 0:
+                self.stats["acquired"] += 1
+                return
+            self.stats["waited_sec"] += wait
+            await asyncio.sleep(wait)
+
+    def _take_successes(self) -> int:
+        """記一次成功；累計到 SUCCESS_FLUSH 次時回傳要寫回的次數，否則回傳 0"""
+        with self._pending_lock:
+            self._pending_success += 1
+            if self._pending_success < SUCCESS_FLUSH:
+                return 0
+            n, self._pending_success = self._pending_success, 0
+            return n
+
+    def _flush_successes(self, n: int):
+        def fn(s, now):
+            s["streak"] += n
+            if s["streak"] >= RAMP_UP_AFTER:
+                s["streak"] = 0
+                s["rate"] = min(self.max_rate, s["rate"] + RAMP_UP_STEP)
+        self._update(fn)
+
+    def on_success(self):
+        n = self._take_successes()
+        if n:
+            self._flush_successes(n)
+
+    async def on_success_async(self):
+        n = self._take_successes()
+        if n:
+            await self._in_thread(self._flush_successes, n)
+
+    def on_rate_limited(self, retry_after: float = 1.0):
+        self.stats["rate_limited"] += 1
+        with self._pending_lock:
+            self._pending_success = 0
+        def fn(s, now):
+            s["streak"] = 0
+            if now - (s["last_backoff"] or 0) >= retry_after:  # 同一波 429 只減速一次
+                s["rate"] = max(self.min_rate, s["rate"] * BACKOFF_FACTOR)
+                s["last_backoff"] = now
+            s["tokens"] = 0.0
+            s["updated"] = now
+            s["cooldown_until"] = max(s["cooldown_until"], now + retry_after)
+        self._update(fn)
+
+    async def on_rate_limited_async(self, retry_after: float = 1.0):
+        await self._in_thread(self.on_rate_limited, retry_after)
+
+    def current_rate(self) -> float:
+        """只讀取，不開寫入交易"""
+        row = self._conn().execute("SELECT rate FROM buckets WHERE name = ?", (self.name,)).fetchone()
+        return row[0]
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"rate[{self.name}]: 目前 {self.current_rate():.1f} req/s | 429 {s['rate_limited']} 次"
+                f" | 等待 {s['waited_sec']:.1f}s")
+
+_limiters: Dict[str, AdaptiveRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(name: str = "spotify", **settings) -> AdaptiveRateLimiter:
+    """同一行程內同名 bucket 共用一個物件；跨行程則透過 RATE_DB_PATH 共用狀態。
+    settings（initial_rate / min_rate / max_rate / burst）只在第一次建立時套用，預設為 Spotify 的數值。"""
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = AdaptiveRateLimiter(name, **settings)
+        return _limiters[name]
+
+def retry_after_seconds(resp, default: float = 1.0) -> float:
+    try:
+        return float(resp.headers.get("Retry-After", default)) + 1
+    except (TypeError, ValueError):
+        return default + 1
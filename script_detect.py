@@ -0,0 +1,202 @@
+# script_detect.py
+# 作用：掃一次文字，統計各文字系統（漢字 / 假名 / 諺文 / 西語字母 / 英文字母）的字數，再依統計結果判斷語言
+# - 判斷結果與 classify_pick_and_merge 原本的 is_chinese → is_japanese → is_korean → is_spanish → is_english
+#   依序檢查完全相同，只是不必對同一段歌詞跑好幾次 regex
+# - 統計用 NumPy：文字轉成 codepoint 陣列查表後 bincount，一批文字可一起轉換
+# - 沒有 NumPy 時 script_histogram 改用 collections.Counter（純 Python）；但這比 regex 慢，
+#   所以 detect_lang 在沒有 NumPy 時仍用原本的 regex 依序判斷（遇到第一個符合就停）
+# - 統計結果也能拿來比較假名與漢字的比例（kana_ratio），例如區分日文歌詞與中文歌詞
+#
+# 用法：
+#   lang = detect_lang(lyrics)                  # "伴奏" / "中文" / ... / None（判斷不出來）
+#   langs = detect_langs(list_of_texts)         # 一批一起算
+#   python script_detect.py bench               # 與原本 regex 判斷比較速度（會先確認結果一致）
+import argparse
+import random
+import re
+import time
+from collections import Counter
+from typing import List, NamedTuple, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # 沒有 NumPy 時改用純 Python
+    np = None
+
+# 分類代碼；範圍與 classify_pick_and_merge 的 regex 相同
+OTHER, HAN, KANA, HANGUL, SPANISH, LATIN = range(6)
+N_SCRIPTS = 6
+SPANISH_CHARS = "ñáéíóúü¡¿ÑÁÉÍÓÚÜ"  # [ñáéíóúü¡¿] 加上 re.IGNORECASE
+
+INSTRUMENTAL_KEYWORDS = [
+    "instrumental", "伴奏", "karaoke", "off vocal", "minus one", "inst",
+    "バックトラック", "노래방", "mr "
+]
+
+class ScriptCounts(NamedTuple):
+    han: int = 0
+    kana: int = 0
+    hangul: int = 0
+    spanish: int = 0
+    latin: int = 0
+
+    @property
+    def kana_ratio(self) -> float:
+        """假名 / (假名 + 漢字)；都沒有時為 0"""
+        total = self.kana + self.han
+        return self.kana / total if total else 0.0
+
+def _category(cp: int) -> int:
+    if 0x4E00 <= cp <= 0x9FFF:
+        return HAN
+    if 0x3040 <= cp <= 0x30FF:
+        return KANA
+    if 0xAC00 <= cp <= 0xD7AF:
+        return HANGUL
+    if 0x41 <= cp <= 0x5A or 0x61 <= cp <= 0x7A:
+        return LATIN
+    if chr(cp) in SPANISH_CHARS:
+        return SPANISH
+    return OTHER
+
+_TABLE = None
+
+def _table():
+    """codepoint → 分類代碼；BMP 以外（0x10000 以上）都歸在最後一格 OTHER"""
+    global _TABLE
+    if _TABLE is None:
+        t = np.zeros(0x10001, dtype=np.uint8)
+        t[0x4E00:0xA000] = HAN
+        t[0x3040:0x3100] = KANA
+        t[0xAC00:0xD7B0] = HANGUL
+        t[0x41:0x5B] = LATIN
+        t[0x61:0x7B] = LATIN
+        t[[ord(c) for c in SPANISH_CHARS]] = SPANISH
+        _TABLE = t
+    return _TABLE
+
+def _counts(row) -> ScriptCounts:
+    return ScriptCounts(int(row[HAN]), int(row[KANA]), int(row[HANGUL]), int(row[SPANISH]), int(row[LATIN]))
+
+def _histogram_counter(text: str) -> ScriptCounts:
+    row = [0] * N_SCRIPTS
+    for ch, n in Counter(text).items():
+        row[_category(ord(ch))] += n
+    return _counts(row)
+
+def _categories(text: str):
+    """每個字元的分類代碼（NumPy uint8 陣列）"""
+    cps = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    return _table()[np.minimum(cps, 0x10000)]
+
+def script_histogram(text: str) -> ScriptCounts:
+    if np is None:
+        return _histogram_counter(text)
+    return _counts(np.bincount(_categories(text), minlength=N_SCRIPTS))
+
+def script_histograms(texts: Sequence[str]) -> List[ScriptCounts]:
+    """一批文字的統計；有 NumPy 時整批一次轉成 codepoint 陣列再分段計數"""
+    if np is None:
+        return [_histogram_counter(t) for t in texts]
+    cats = _categories("".join(texts))
+    out, pos = [], 0
+    for t in texts:
+        out.append(_counts(np.bincount(cats[pos:pos + len(t)], minlength=N_SCRIPTS)))
+        pos += len(t)
+    return out
+
+def is_instrumental(t: str) -> bool:
+    tl = t.lower()
+    return any(k in tl for k in INSTRUMENTAL_KEYWORDS)
+
+def decide(counts: ScriptCounts) -> Optional[str]:
+    """與原本的 regex 判斷順序相同（不含伴奏）；判斷不出來回傳 None"""
+    if counts.han:
+        return "中文"
+    if counts.kana:       # is_japanese 也含漢字，但漢字在上一步已經判斷成中文
+        return "日文"
+    if counts.hangul:
+        return "韓文"
+    if counts.spanish:
+        return "西班牙語"
+    if counts.latin >= 3:
+        return "英文"
+    return None
+
+def _decide_by_regex(t: str) -> Optional[str]:
+    """原本 classify_row 的判斷方式（不含伴奏）；沒有 NumPy 時使用"""
+    if re.search(r"[\u4e00-\u9fff]", t): return "中文"
+    if re.search(r"[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF]", t): return "日文"
+    if re.search(r"[\uac00-\ud7af]", t): return "韓文"
+    if re.search(r"[ñáéíóúü¡¿]", t, re.IGNORECASE): return "西班牙語"
+    if len(re.findall(r"[A-Za-z]", t)) >= 3: return "英文"
+    return None
+
+def detect_lang(text: str, counts: Optional[ScriptCounts] = None) -> Optional[str]:
+    """伴奏關鍵字 → 依文字系統判斷；判斷不出來回傳 None"""
+    if not text:
+        return None
+    if is_instrumental(text):
+        return "伴奏"
+    if counts is None and np is None:
+        return _decide_by_regex(text)
+    return decide(counts if counts is not None else script_histogram(text))
+
+def detect_langs(texts: Sequence[str]) -> List[Optional[str]]:
+    if np is None:
+        return [detect_lang(t) for t in texts]
+    return [detect_lang(t, c) for t, c in zip(texts, script_histograms(texts))]
+
+# ---- 效能比較 ----
+
+def _detect_by_regex(t: str) -> Optional[str]:
+    if not t:
+        return None
+    return "伴奏" if is_instrumental(t) else _decide_by_regex(t)
+
+def _sample_lyrics(n: int, chars: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    pools = {
+        "en": "the love night heart baby you and me never again\n",
+        "ja": "あなたのことを想うたびに夜空に星が光るよ\n",
+        "ja_han": "君の名前を呼ぶ夜空に星が光る\n",
+        "ko": "사랑해 너를 기다리는 밤하늘의 별빛\n",
+        "es": "corazón mañana canción así quiero\n",
+        "zh": "我們的愛情像夜空中的星星閃耀\n",
+        "num": "1234 5678 ... !!! ??? \n",
+    }
+    keys = list(pools)
+    out = []
+    for _ in range(n):
+        pool = pools[rng.choice(keys)]
+        out.append((pool * (chars // len(pool) + 1))[:rng.randint(chars // 4, chars)])
+    return out
+
+def bench(n: int, chars: int):
+    texts = _sample_lyrics(n, chars)
+    t0 = time.perf_counter()
+    old = [_detect_by_regex(t) for t in texts]
+    t1 = time.perf_counter()
+    one = [detect_lang(t) for t in texts]
+    t2 = time.perf_counter()
+    batch = detect_langs(texts)
+    t3 = time.perf_counter()
+    if not (old == one == batch):
+        raise SystemExit("❌ 結果與 regex 判斷不一致")
+    engine = "NumPy" if np is not None else "Counter（未安裝 NumPy）"
+    print(f"{n} 段歌詞，每段最多 {chars} 字；統計方式：{engine}")
+    print(f"regex 逐項判斷：{t1 - t0:.2f}s（{1e6 * (t1 - t0) / n:.0f} µs/段）")
+    print(f"字數統計（逐段）：{t2 - t1:.2f}s（{1e6 * (t2 - t1) / n:.0f} µs/段）")
+    print(f"字數統計（整批）：{t3 - t2:.2f}s（{1e6 * (t3 - t2) / n:.0f} µs/段）")
+    print("✅ 三種方式結果一致")
+
+def main():
+    ap = argparse.ArgumentParser(description="比較字數統計與 regex 的語言判斷速度")
+    ap.add_argument("command", choices=["bench"])
+    ap.add_argument("--texts", type=int, default=2000, help="測試的歌詞段數")
+    ap.add_argument("--chars", type=int, default=20000, help="每段最多字數（對應 MAX_LYRICS_CHARS）")
+    a = ap.parse_args()
+    bench(a.texts, a.chars)
+
+if __name__ == "__main__":
+    main()
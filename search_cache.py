@@ -0,0 +1,155 @@
+# search_cache.py
+# 作用：把「歌名/歌手/專輯/市場 → TrackURI」的搜尋結果存進 SQLite，下次匯入同一首歌不必再打 API
+# - 找到的結果（hit）保存 HIT_TTL_DAYS 天
+# - 找不到（miss）也記下來，但只保存 MISS_TTL_DAYS 天，之後會重新搜尋
+# - 超過 MAX_ENTRIES 筆時，依最後使用時間(LRU)淘汰最舊的
+#
+# 用法：
+#   python search_cache.py stats                 # 顯示快取統計
+#   python search_cache.py prune                 # 刪除過期項目並套用 MAX_ENTRIES
+#   python search_cache.py prune --max-entries 50000 --misses
+import argparse
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Optional, Tuple
+
+CACHE_DB_PATH = Path("search_cache.db")
+HIT_TTL_DAYS = 180
+MISS_TTL_DAYS = 7
+MAX_ENTRIES = 200_000
+
+DAY = 86400
+
+def norm_key(s: Optional[str]) -> str:
+    """NFKC + casefold + 合併空白，讓大小寫/全半形不同的同一首歌共用快取"""
+    if not s:
+        return ""
+    s = unicodedata.normalize("NFKC", s).casefold()
+    return re.sub(r"\s+", " ", s).strip()
+
+class SearchCache:
+    def __init__(self, db_path: Path = CACHE_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.stats = {"hits": 0, "negative_hits": 0, "misses": 0, "stores": 0}
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS resolutions ("
+            " scope TEXT, title TEXT, artist TEXT, album TEXT, market TEXT,"
+            " uri TEXT, created REAL, last_used REAL,"
+            " PRIMARY KEY (scope, title, artist, album, market))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_resolutions_last_used ON resolutions (last_used)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    @staticmethod
+    def _key(scope, title, artist, album, market):
+        return (scope, norm_key(title), norm_key(artist), norm_key(album), (market or "").upper())
+
+    def get(self, scope: str, title: str, artist: str, album: str, market: str) -> Tuple[bool, Optional[str]]:
+        """回傳 (是否命中快取, uri)；命中但 uri 為 None 表示「之前就找不到」"""
+        key = self._key(scope, title, artist, album, market)
+        row = self._conn().execute(
+            "SELECT uri, created FROM resolutions WHERE scope=? AND title=? AND artist=? AND album=? AND market=?",
+            key,
+        ).fetchone()
+        now = time.time()
+        if row is not None:
+            uri, created = row
+            ttl = (HIT_TTL_DAYS if uri else MISS_TTL_DAYS) * DAY
+            if now - created < ttl:
+                self._conn().execute(
+                    "UPDATE resolutions SET last_used=? WHERE scope=? AND title=? AND artist=? AND album=? AND market=?",
+                    (now, *key),
+                )
+                self._count("hits" if uri else "negative_hits")
+                return True, uri
+        self._count("misses")
+        return False, None
+
+    def put(self, scope: str, title: str, artist: str, album: str, market: str, uri: Optional[str]):
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO resolutions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (*self._key(scope, title, artist, album, market), uri, now, now),
+        )
+        self._count("stores")
+
+    def prune(self, max_entries: int = MAX_ENTRIES, drop_misses: bool = False) -> int:
+        """刪除過期項目（及選擇性地刪除所有 miss），再依 LRU 把總數壓到 max_entries 以下"""
+        conn = self._conn()
+        now = time.time()
+        before = conn.execute("SELECT COUNT(*) FROM resolutions").fetchone()[0]
+        conn.execute("DELETE FROM resolutions WHERE uri IS NOT NULL AND created < ?", (now - HIT_TTL_DAYS * DAY,))
+        if drop_misses:
+            conn.execute("DELETE FROM resolutions WHERE uri IS NULL")
+        else:
+            conn.execute("DELETE FROM resolutions WHERE uri IS NULL AND created < ?", (now - MISS_TTL_DAYS * DAY,))
+        conn.execute(
+            "DELETE FROM resolutions WHERE rowid IN ("
+            " SELECT rowid FROM resolutions ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (max_entries,),
+        )
+        after = conn.execute("SELECT COUNT(*) FROM resolutions").fetchone()[0]
+        return before - after
+
+    def table_stats(self) -> dict:
+        conn = self._conn()
+        hits, misses = conn.execute(
+            "SELECT COUNT(uri), COUNT(*) - COUNT(uri) FROM resolutions"
+        ).fetchone()
+        oldest = conn.execute("SELECT MIN(last_used) FROM resolutions").fetchone()[0]
+        size = self.db_path.stat().st_size if self.db_path.exists() else 0
+        return {"hits": hits, "misses": misses, "oldest_used": oldest, "bytes": size}
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"search cache: 命中 {s['hits']} | 命中(找不到) {s['negative_hits']}"
+                f" | 未命中 {s['misses']} | 寫入 {s['stores']}")
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_search_cache() -> SearchCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SearchCache()
+            _cache.prune()  # 每次執行先清掉過期與超量的項目
+        return _cache
+
+def main():
+    ap = argparse.ArgumentParser(description="查看或清理搜尋快取（search_cache.db）")
+    ap.add_argument("command", choices=["stats", "prune"])
+    ap.add_argument("--db", default=str(CACHE_DB_PATH), help="快取資料庫路徑")
+    ap.add_argument("--max-entries", type=int, default=MAX_ENTRIES, help="最多保留幾筆（LRU）")
+    ap.add_argument("--misses", action="store_true", help="prune：一併刪除所有「找不到」的紀錄")
+    args = ap.parse_args()
+
+    cache = SearchCache(Path(args.db))
+    if args.command == "prune":
+        removed = cache.prune(args.max_entries, drop_misses=args.misses)
+        print(f"已刪除 {removed} 筆")
+    st = cache.table_stats()
+    oldest = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(st["oldest_used"])) if st["oldest_used"] else "-"
+    print(f"找到的結果 {st['hits']} 筆 | 找不到 {st['misses']} 筆 | 最久未使用 {oldest} | 檔案大小 {st['bytes'] / 1024:.0f} KB")
+
+if __name__ == "__main__":
+    main()
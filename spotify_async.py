@@ -0,0 +1,70 @@
+# spotify_async.py
+# 作用：asyncio 版的 spotify_get / spotify_post，讓搜尋、分頁下載可以同時送出多個請求
+# - 以 asyncio.Semaphore 限制同時進行的請求數（concurrency）
+# - 與 token_helper 共用同一個 TokenManager（只會 refresh 一次）
+# - 與同步版共用 rate_limiter 的額度；遇到 429 時所有請求一起依 Retry-After 暫停
+#   （rate_limiter 的 SQLite 交易在執行緒中執行，不會卡住 event loop）
+# - 實際 I/O 走 http_client 的共用連線池（在執行緒池中執行，不需額外套件）
+#
+# 用法：
+#   async with AsyncSpotify(concurrency=8) as client:
+#       resp = await client.get(url, params={...})
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from http_client import get_session
+from rate_limiter import get_limiter, retry_after_seconds
+from token_helper import ensure_access_token, invalidate_access_token
+
+DEFAULT_CONCURRENCY = 8
+
+class AsyncSpotify:
+    def __init__(self, concurrency: int = DEFAULT_CONCURRENCY, max_retry: int = 5):
+        self.concurrency = max(1, concurrency)
+        self.max_retry = max_retry
+        self._sem = asyncio.Semaphore(self.concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="spotify-async")
+        self._limiter = get_limiter()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(fn, *args, **kwargs))
+
+    async def request(self, method: str, url: str, params=None, json_body=None, timeout: float = 20, headers=None):
+        for i in range(self.max_retry):
+            async with self._sem:
+                token = await self._run(ensure_access_token)
+                await self._limiter.acquire_async()
+                send_headers = {**(headers or {}), "Authorization": f"Bearer {token}"}
+                if json_body is not None:
+                    send_headers["Content-Type"] = "application/json"
+                resp = await self._run(
+                    get_session().request, method, url,
+                    headers=send_headers, params=params, json=json_body, timeout=timeout,
+                )
+            if resp.status_code == 429:
+                await self._limiter.on_rate_limited_async(retry_after_seconds(resp))
+                continue
+            await self._limiter.on_success_async()
+            if resp.status_code == 401 and i < self.max_retry - 1:
+                await self._run(invalidate_access_token, token)
+                continue
+            resp.raise_for_status()
+            return resp
+        raise RuntimeError(f"{method} {url} failed after retries")
+
+    async def get(self, url: str, params=None, headers=None):
+        return await self.request("GET", url, params=params, headers=headers)
+
+    async def post(self, url: str, json_body=None, params=None):
+        return await self.request("POST", url, params=params, json_body=json_body, timeout=30)
@@ -24,6 +24,12 @@ Options:
   --token             OAuth token with 'Bearer ' prefix (otherwise use env SPOTIFY_OAUTH)
   --user              Spotify user id (otherwise use env SPOTIFY_USER_ID)
   --description       Description to set on created playlists (applies to all)
+  --resume            Continue each CSV from its import_journal_<name>.jsonl (same playlist,
+                      no repeated searches, skip chunks Spotify already acknowledged)
+  --index-ttl         Seconds to reuse the playlist name index cached in playlist_index.json
+                      (default 600; 0 = fetch /v1/me/playlists once per run, no file)
+  --jobs N            Import N CSV files at once; they share one HTTP session, the rate
+                      limiter and the playlist index (default 1 = one after another)
 """
 
 import argparse
@@ -31,28 +37,30 @@ import csv
 import json
 import os
 import sys
+import threading
 import time
-import unicodedata
-from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, NamedTuple, Optional, Tuple
 import requests
 from pathlib import Path
 
-SEARCH_ENDPOINT = "https://api.spotify.com/v1/search"
+from batch_upload import MAX_UNACKED, PositionRejected, is_position_error, upload_uris
+from http_client import get_session, http_stats
+from import_journal import ImportJournal
+from rate_limiter import get_limiter, retry_after_seconds
+from search_cache import get_search_cache
+from track_matcher import SEARCH_ENDPOINT, TrackMatcher
+
 CREATE_PLAYLIST_ENDPOINT = "https://api.spotify.com/v1/users/{user_id}/playlists"
+PLAYLIST_ENDPOINT = "https://api.spotify.com/v1/playlists/{playlist_id}"
 PLAYLIST_ITEMS_ENDPOINT = "https://api.spotify.com/v1/playlists/{playlist_id}/tracks"
 GET_ME_ENDPOINT = "https://api.spotify.com/v1/me"
 GET_PLAYLISTS_ENDPOINT = "https://api.spotify.com/v1/me/playlists"
+PLAYLIST_INDEX_PATH = Path("playlist_index.json")
+PLAYLIST_INDEX_TTL_SEC = 600  # reuse the persisted name index for 10 minutes; 0 = fetch every run
+PROGRESS_EVERY = 50  # --jobs > 1: print one progress line per file every N rows
 
-def norm(s: str) -> str:
-    if s is None:
-        return ""
-    s = unicodedata.normalize("NFKC", s).lower().strip()
-    for ch in ['“','”','‘','’','–','—','‐','‑','‒']:
-        s = s.replace(ch, ' ')
-    import re
-    s = re.sub(r"[^\w\s]", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+matcher = TrackMatcher()  # shared matching engine (also used by csv2playlist.py)
 
 def split_artists(artists_field: str) -> List[str]:
     if not artists_field:
@@ -62,72 +70,75 @@ def split_artists(artists_field: str) -> List[str]:
 def handle_rate(resp: requests.Response) -> bool:
     """Return True if caller should retry (handled 429), else False."""
     if resp.status_code == 429:
-        retry_after = int(resp.headers.get("Retry-After", "1"))
-        time.sleep(retry_after + 1)
+        get_limiter().on_rate_limited(retry_after_seconds(resp))
         return True
+    get_limiter().on_success()
     return False
 
+def send(session, method: str, url: str, acquired: bool=False, **kwargs):
+    """Send one request through the shared rate limiter, retrying on 429.
+    acquired=True: the caller already took the token for the first attempt (batch_upload)."""
+    while True:
+        if not acquired:
+            get_limiter().acquire()
+        acquired = False
+        resp = session.request(method, url, **kwargs)
+        if not handle_rate(resp):
+            return resp
+
 def search_track(session: requests.Session, token: str, title: str, artists: List[str], album: str) -> Optional[str]:
+    """Resolve a track URI with the shared matcher: one wide search scored locally, a looser
+    follow-up only when confidence is low; results go through the persistent search cache.
+    A failed search (401/403/5xx) raises; rows searched so far stay in the journal for --resume."""
     headers = {"Authorization": token}
-    queries = []
-    main_artist = artists[0] if artists else ""
-    if album:
-        queries.append(f'track:"{title}" artist:"{main_artist}" album:"{album}"')
-    if main_artist:
-        queries.append(f'track:"{title}" artist:"{main_artist}"')
-    queries.append(f'track:"{title}"')
-
-    target_title = norm(title)
-    target_album = norm(album)
-    target_artists = {norm(a) for a in artists}
-
-    for q in queries:
-        params = {"q": q, "type": "track", "limit": 10}
-        resp = session.get(SEARCH_ENDPOINT, headers=headers, params=params)
-        if handle_rate(resp):
-            resp = session.get(SEARCH_ENDPOINT, headers=headers, params=params)
+
+    def fetch(params: dict) -> dict:
+        resp = send(session, "GET", SEARCH_ENDPOINT, headers=headers, params=params)
         if not resp.ok:
-            continue
-        items = resp.json().get("tracks", {}).get("items", [])‵
-        best_uri, best_score = None, -1
-        for it in items:
-            it_title = norm(it.get("name",""))
-            it_album = norm((it.get("album") or {}).get("name",""))
-            it_artists = {norm(a.get("name","")) for a in (it.get("artists") or [])}
-            score = 0
-            if it_title == target_title:
-                score += 3
-            elif target_title and target_title in it_title:
-                score += 2
-            if target_artists & it_artists:
-                score += 3
-            if target_album and (it_album == target_album or target_album in it_album):
-                score += 1
-            for a in target_artists:
-                if a and any(a in x for x in it_artists):
-                    score += 1
-            if score > best_score:
-                best_score = score
-                best_uri = it.get("uri")
-        if best_uri:
-            return best_uri
-    return None
-
-def add_tracks(session: requests.Session, token: str, playlist_id: str, uris: List[str], dry_run: bool=False) -> None:
+            # An error is not "no candidates": raise so the matcher does not cache it as a miss
+            print(f"[ERROR] Search failed {resp.status_code}: {resp.text[:200]}", file=sys.stderr)
+            resp.raise_for_status()
+        return resp.json()
+
+    return matcher.match(fetch, title, artists, album).uri
+
+def add_tracks(session: requests.Session, token: str, playlist_id: str, uris: List[str], dry_run: bool=False,
+               journal: Optional[ImportJournal]=None) -> None:
+    """Append URIs with pipelined positional uploads (batch_upload: several 100-track chunks in
+    flight, each with an explicit position, so the final order is deterministic). With a journal,
+    skip chunks already acknowledged and stop at the first failed chunk so --resume can pick up
+    from there; without one, a failed chunk is reported and skipped."""
     if dry_run or not uris:
         return
     headers = {"Authorization": token, "Content-Type": "application/json"}
     url = PLAYLIST_ITEMS_ENDPOINT.format(playlist_id=playlist_id)
-    for i in range(0, len(uris), 100):
-        chunk = uris[i:i+100]
-        body = {"uris": chunk}
-        while True:
-            resp = session.post(url, headers=headers, data=json.dumps(body))
-            if handle_rate(resp):
-                continue
-            if not resp.ok:
-                print(f"[ERROR] Add chunk failed {resp.status_code}: {resp.text}", file=sys.stderr)
-            break
+    resp = send(session, "GET", PLAYLIST_ENDPOINT.format(playlist_id=playlist_id),
+                headers={"Authorization": token}, params={"fields": "tracks.total"})
+    resp.raise_for_status()
+    length = resp.json()["tracks"]["total"]  # reused playlists: append after the existing tracks
+    if journal and journal.base is None and not journal.added:
+        journal.record_base(length)  # first upload into this playlist
+    elif journal:
+        # Chunks written before the last run stopped but never acknowledged: count them as added
+        surplus = journal.reconcile(length, MAX_UNACKED)
+        if surplus:
+            print(f"[RESUME] Playlist has {surplus} more tracks than the journal; not re-adding them")
+    start = journal.added if journal else 0
+
+    def post_chunk(chunk: List[str], position: int):
+        resp = send(session, "POST", url, acquired=True, headers=headers,
+                    data=json.dumps({"uris": chunk, "position": position}))
+        if is_position_error(resp):
+            raise PositionRejected(resp.text)
+        if not resp.ok:
+            print(f"[ERROR] Add chunk failed {resp.status_code}: {resp.text}", file=sys.stderr)
+            raise RuntimeError(f"add chunk failed with {resp.status_code}")
+
+    on_ack = (lambda acked: journal.record_batch(start + acked)) if journal else None
+    try:
+        upload_uris(post_chunk, uris[start:], start_position=length, on_ack=on_ack, skip_failed=journal is None)
+    except RuntimeError as e:
+        print(f"[ERROR] Stopped adding tracks ({e}); rerun with --resume to continue", file=sys.stderr)
 
 def read_csv_rows(path: str) -> List[Dict[str,str]]:
     rows = []
@@ -141,50 +152,107 @@ def ensure_user_id(session: requests.Session, token: str, user_id: Optional[str]
     if user_id:
         return user_id
     headers = {"Authorization": token}
-    resp = session.get(GET_ME_ENDPOINT, headers=headers)
-    if handle_rate(resp):
-        resp = session.get(GET_ME_ENDPOINT, headers=headers)
+    resp = send(session, "GET", GET_ME_ENDPOINT, headers=headers)
     resp.raise_for_status()
     return resp.json().get("id")
 
-def find_existing_playlist(session: requests.Session, token: str, name: str) -> Optional[str]:
-    headers = {"Authorization": token}
-    url = GET_PLAYLISTS_ENDPOINT
-    params = {"limit": 50}
-    while True:
-        resp = session.get(url, headers=headers, params=params)
-        if handle_rate(resp):
-            continue
-        if not resp.ok:
-            break
-        data = resp.json()
-        for pl in data.get("items", []):
-            if pl.get("name") == name:
-                return pl.get("id")
-        if data.get("next"):
-            url = data["next"]
-            params = None
-        else:
-            break
-    return None
+class PlaylistIndex:
+    """Name -> playlist ID map of the current user's playlists, paged from /v1/me/playlists
+    once per run. With ttl > 0 it is also persisted to PLAYLIST_INDEX_PATH and reused by
+    later runs until it expires; create_playlist() keeps it up to date."""
 
-def create_playlist(session: requests.Session, token: str, user_id: str, name: str, public: bool, description: str, dry_run: bool) -> str:
+    def __init__(self, session: requests.Session, token: str, user_id: str,
+                 path: Path = PLAYLIST_INDEX_PATH, ttl: int = PLAYLIST_INDEX_TTL_SEC):
+        self.session = session
+        self.token = token
+        self.user_id = user_id
+        self.path = path
+        self.ttl = ttl
+        self.fetched_at = 0.0
+        self.complete = False
+        self.lock = threading.RLock()  # --jobs: one fetch, and no duplicate creates for the same name
+        self._ids: Optional[Dict[str, str]] = None
+
+    def _load_persisted(self) -> bool:
+        if self.ttl <= 0 or not self.path.exists():
+            return False
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False
+        if data.get("user_id") != self.user_id or time.time() - data.get("fetched_at", 0) > self.ttl:
+            return False
+        self._ids = dict(data.get("playlists") or {})
+        self.fetched_at = data["fetched_at"]
+        self.complete = True
+        print(f"[INDEX] Loaded {len(self._ids)} playlists from {self.path} "
+              f"(age {int(time.time() - self.fetched_at)}s)")
+        return True
+
+    def _fetch(self):
+        headers = {"Authorization": self.token}
+        url = GET_PLAYLISTS_ENDPOINT
+        params = {"limit": 50}
+        ids: Dict[str, str] = {}
+        self.complete = False
+        while True:
+            resp = send(self.session, "GET", url, headers=headers, params=params)
+            if not resp.ok:
+                break
+            data = resp.json()
+            for pl in data.get("items", []):
+                if pl and pl.get("name") is not None:
+                    ids.setdefault(pl["name"], pl.get("id"))  # first match wins, as before
+            if data.get("next"):
+                url = data["next"]
+                params = None
+            else:
+                self.complete = True
+                break
+        self._ids = ids
+        self.fetched_at = time.time()
+        print(f"[INDEX] Fetched {len(ids)} playlists")
+        self._save()
+
+    def _save(self):
+        if self.ttl <= 0 or not self.complete:
+            return  # a partial listing must not hide playlists from later runs
+        body = {"user_id": self.user_id, "fetched_at": self.fetched_at, "playlists": self._ids}
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(body, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def get(self, name: str) -> Optional[str]:
+        with self.lock:
+            if self._ids is None and not self._load_persisted():
+                self._fetch()
+            return self._ids.get(name)
+
+    def add(self, name: str, playlist_id: str):
+        with self.lock:
+            if self._ids is None:
+                return
+            self._ids.setdefault(name, playlist_id)
+            self._save()
+
+def create_playlist(session: requests.Session, token: str, user_id: str, name: str, public: bool, description: str, dry_run: bool,
+                    index: PlaylistIndex) -> str:
     if dry_run:
         print(f"[DRY] Would create (or reuse) playlist: {name}")
         return "DRY_PLAYLIST_ID"
-    # Reuse if exists
-    exist = find_existing_playlist(session, token, name)
-    if exist:
-        print(f"[OK ] Reusing existing playlist: {name} ({exist})")
-        return exist
-    headers = {"Authorization": token, "Content-Type": "application/json"}
-    url = CREATE_PLAYLIST_ENDPOINT.format(user_id=user_id)
-    body = {"name": name, "public": public, "description": description[:300] if description else ""}
-    resp = session.post(url, headers=headers, data=json.dumps(body))
-    if handle_rate(resp):
-        resp = session.post(url, headers=headers, data=json.dumps(body))
-    resp.raise_for_status()
-    pid = resp.json().get("id")
+    with index.lock:
+        # Reuse if exists
+        exist = index.get(name)
+        if exist:
+            print(f"[OK ] Reusing existing playlist: {name} ({exist})")
+            return exist
+        headers = {"Authorization": token, "Content-Type": "application/json"}
+        url = CREATE_PLAYLIST_ENDPOINT.format(user_id=user_id)
+        body = {"name": name, "public": public, "description": description[:300] if description else ""}
+        resp = send(session, "POST", url, headers=headers, data=json.dumps(body))
+        resp.raise_for_status()
+        pid = resp.json().get("id")
+        index.add(name, pid)
     print(f"[OK ] Created playlist: {name} ({pid})")
     return pid
 
@@ -192,25 +260,69 @@ def infer_playlist_name(path: str, prefix: str, suffix: str) -> str:
     base = Path(path).stem  # filename without extension
     return f"{prefix}{base}{suffix}"
 
-def process_csv(session: requests.Session, token: str, playlist_id: str, csv_path: str, dry_run: bool=False) -> int:
+def process_csv(session: requests.Session, token: str, playlist_id: str, csv_path: str, dry_run: bool=False,
+                journal: Optional[ImportJournal]=None, verbose: bool=True) -> Tuple[int, int]:
+    """Search every row and add the matches; returns (matched, rows). With verbose=False
+    (parallel --jobs runs) per-row lines are replaced by a progress line every PROGRESS_EVERY rows."""
     rows = read_csv_rows(csv_path)
+    label = Path(csv_path).name
     uris = []
     added = 0
-    for row in rows:
+    for index, row in enumerate(rows):
         title = row.get("Track Name") or row.get("Title") or ""
         artists_field = row.get("Artist Name(s)") or row.get("Artist") or ""
         album = row.get("Album Name") or row.get("Album") or ""
         artists = split_artists(artists_field)
-        uri = search_track(session, token, title, artists, album)
+        if journal and index in journal.resolved:
+            uri = journal.resolved[index]
+        else:
+            uri = search_track(session, token, title, artists, album)
+            if journal:
+                journal.record_row(index, uri)
         if uri:
             uris.append(uri)
             added += 1
-            print(f"[FOUND] {title} — {artists_field}")
-        else:
+            if verbose:
+                print(f"[FOUND] {title} — {artists_field}")
+        elif verbose:
             print(f"[MISS ] {title} — {artists_field}")
-    add_tracks(session, token, playlist_id, uris, dry_run=dry_run)
+        if not verbose and ((index + 1) % PROGRESS_EVERY == 0 or index + 1 == len(rows)):
+            print(f"[PROG ] {label}: {index + 1}/{len(rows)} rows searched, {added} matched")
+    add_tracks(session, token, playlist_id, uris, dry_run=dry_run, journal=journal)
+    if journal and journal.added >= len(uris):
+        journal.finish()
     print(f"[DONE] {csv_path}: matched {added}/{len(rows)}")
-    return added
+    return added, len(rows)
+
+class ImportResult(NamedTuple):
+    csv_path: str
+    playlist_id: Optional[str]  # None: skipped because the journal says it is done
+    matched: int
+    rows: int
+
+def import_csv(session: requests.Session, token: str, user_id: str, index: PlaylistIndex, csv_path: str,
+               args: argparse.Namespace, public: bool, verbose: bool=True) -> ImportResult:
+    """Create (or reuse / resume) the playlist for one CSV and import it."""
+    journal = None if args.dry_run else ImportJournal(Path(csv_path), resume=args.resume)
+    if journal and journal.done:
+        print(f"[SKIP] {csv_path}: already imported (journal {journal.path.name})")
+        journal.close()
+        return ImportResult(csv_path, None, 0, 0)
+    if journal and journal.resuming:
+        pid = journal.playlist_id
+        print(f"[RESUME] {csv_path}: playlist {pid}, {len(journal.resolved)} rows resolved, {journal.added} tracks added")
+    else:
+        pname = infer_playlist_name(csv_path, args.playlist_prefix, args.playlist_suffix)
+        pid = create_playlist(session, token, user_id, pname, public=public, description=args.description, dry_run=args.dry_run,
+                              index=index)
+        if journal:
+            journal.start(pid)
+    try:
+        matched, rows = process_csv(session, token, pid, csv_path, dry_run=args.dry_run, journal=journal, verbose=verbose)
+    finally:
+        if journal:
+            journal.close()
+    return ImportResult(csv_path, pid, matched, rows)
 
 def main():
     ap = argparse.ArgumentParser(description="Create multiple Spotify playlists from CSV files.")
@@ -223,6 +335,10 @@ def main():
     ap.add_argument("--token", help="OAuth token with 'Bearer ' prefix (or env SPOTIFY_OAUTH)")
     ap.add_argument("--user", help="Spotify user id (or env SPOTIFY_USER_ID)")
     ap.add_argument("--description", default="Imported via CSV", help="Playlist description")
+    ap.add_argument("--resume", action="store_true", help="Resume each CSV from its import journal")
+    ap.add_argument("--index-ttl", type=int, default=PLAYLIST_INDEX_TTL_SEC,
+                    help=f"Seconds to reuse the persisted playlist name index (0 = always refetch; default {PLAYLIST_INDEX_TTL_SEC})")
+    ap.add_argument("--jobs", type=int, default=1, help="Import N CSV files concurrently (shared session and rate budget)")
     args = ap.parse_args()
 
     token = args.token or os.getenv("SPOTIFY_OAUTH")
@@ -230,19 +346,37 @@ def main():
         print("ERROR: Provide OAuth token with 'Bearer ' prefix via --token or SPOTIFY_OAUTH env.", file=sys.stderr)
         sys.exit(1)
 
-    session = requests.Session()
+    session = get_session()
     user_id = ensure_user_id(session, token, args.user or os.getenv("SPOTIFY_USER_ID"))
+    index = PlaylistIndex(session, token, user_id, ttl=args.index_ttl)
 
     public = args.public and not args.private  # --public wins; default private
-    created_total = 0
-    for csv_path in args.csv:
-        pname = infer_playlist_name(csv_path, args.playlist_prefix, args.playlist_suffix)
-        pid = create_playlist(session, token, user_id, pname, public=public, description=args.description, dry_run=args.dry_run)
-        if pid != "DRY_PLAYLIST_ID":
-            created_total += 1
-        process_csv(session, token, pid, csv_path, dry_run=args.dry_run)
 
+    def run(csv_path: str):
+        return import_csv(session, token, user_id, index, csv_path, args, public, verbose=args.jobs <= 1)
+
+    if args.jobs <= 1:
+        results = [run(p) for p in args.csv]
+    else:
+        # Files run concurrently but share one session, one rate limiter and one playlist index;
+        # results are collected in argument order so the summary matches a serial run.
+        print(f"[JOBS] Importing {len(args.csv)} CSV files with {args.jobs} workers")
+        pool = ThreadPoolExecutor(max_workers=args.jobs, thread_name_prefix="import")
+        try:
+            futures = [pool.submit(run, p) for p in args.csv]
+            results = [f.result() for f in futures]
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    created_total = sum(1 for r in results if r.playlist_id and r.playlist_id != "DRY_PLAYLIST_ID")
     print(f"\nAll done. Processed {len(args.csv)} CSV files; created/reused {created_total} playlists.")
+    for r in results:
+        status = "skipped (already imported)" if r.playlist_id is None else f"matched {r.matched}/{r.rows}"
+        print(f"  {r.csv_path}: {status}")
+    print(matcher.summary())
+    print(get_search_cache().summary())
+    print(http_stats())
+    print(get_limiter().summary())
 
 if __name__ == "__main__":
     main()
@@ -25,12 +25,13 @@ import csv
 import json
 import os
 import sys
-import time
 import unicodedata
 from typing import List, Dict, Optional
-import requests
 from pathlib import Path
 
+from http_client import get_session, http_stats
+from rate_limiter import get_limiter, retry_after_seconds
+
 SEARCH_ENDPOINT = "https://api.spotify.com/v1/search"
 CREATE_PLAYLIST_ENDPOINT = "https://api.spotify.com/v1/users/{user_id}/playlists"
 PLAYLIST_ITEMS_ENDPOINT = "https://api.spotify.com/v1/playlists/{playlist_id}/tracks"
@@ -55,12 +56,21 @@ def split_artists(artists_field: str) -> List[str]:
     return [a.strip() for a in artists_field.split(";") if a.strip()]
 
 def handle_rate(resp) -> bool:
+    """Return True if caller should retry (handled 429), else False."""
     if resp.status_code == 429:
-        retry_after = int(resp.headers.get("Retry-After", "1"))
-        time.sleep(retry_after + 1)
+        get_limiter().on_rate_limited(retry_after_seconds(resp))
         return True
+    get_limiter().on_success()
     return False
 
+def send(session, method: str, url: str, **kwargs):
+    """Send one request through the shared rate limiter, retrying on 429."""
+    while True:
+        get_limiter().acquire()
+        resp = session.request(method, url, **kwargs)
+        if not handle_rate(resp):
+            return resp
+
 def search_track(session, token: str, title: str, artists: List[str], album: str) -> Optional[str]:
     headers = {"Authorization": token}
     queries = []
@@ -77,9 +87,7 @@ def search_track(session, token: str, title: str, artists: List[str], album: str
 
     for q in queries:
         params = {"q": q, "type": "track", "limit": 10}
-        resp = session.get(SEARCH_ENDPOINT, headers=headers, params=params)
-        if handle_rate(resp):
-            resp = session.get(SEARCH_ENDPOINT, headers=headers, params=params)
+        resp = send(session, "GET", SEARCH_ENDPOINT, headers=headers, params=params)
         if not resp.ok:
             continue
         items = resp.json().get("tracks", {}).get("items", [])
@@ -115,13 +123,9 @@ def add_tracks(session, token: str, playlist_id: str, uris: List[str], dry_run:
     for i in range(0, len(uris), 100):
         chunk = uris[i:i+100]
         body = {"uris": chunk}
-        while True:
-            resp = session.post(url, headers=headers, data=json.dumps(body))
-            if handle_rate(resp):
-                continue
-            if not resp.ok:
-                print("[ERROR] Add chunk failed %s: %s" % (resp.status_code, resp.text), file=sys.stderr)
-            break
+        resp = send(session, "POST", url, headers=headers, data=json.dumps(body))
+        if not resp.ok:
+            print("[ERROR] Add chunk failed %s: %s" % (resp.status_code, resp.text), file=sys.stderr)
 
 def read_csv_rows(path: str) -> List[Dict[str, str]]:
     rows = []
@@ -135,9 +139,7 @@ def ensure_user_id(session, token: str, user_id: Optional[str]) -> str:
     if user_id:
         return user_id
     headers = {"Authorization": token}
-    resp = session.get(GET_ME_ENDPOINT, headers=headers)
-    if handle_rate(resp):
-        resp = session.get(GET_ME_ENDPOINT, headers=headers)
+    resp = send(session, "GET", GET_ME_ENDPOINT, headers=headers)
     resp.raise_for_status()
     return resp.json().get("id")
 
@@ -146,9 +148,7 @@ def find_existing_playlist(session, token: str, name: str) -> Optional[str]:
     url = GET_PLAYLISTS_ENDPOINT
     params = {"limit": 50}
     while True:
-        resp = session.get(url, headers=headers, params=params)
-        if handle_rate(resp):
-            continue
+        resp = send(session, "GET", url, headers=headers, params=params)
         if not resp.ok:
             break
         data = resp.json()
@@ -173,9 +173,7 @@ def create_playlist(session, token: str, user_id: str, name: str, public: bool,
     headers = {"Authorization": token, "Content-Type": "application/json"}
     url = CREATE_PLAYLIST_ENDPOINT.format(user_id=user_id)
     body = {"name": name, "public": public, "description": (description or "")[:300]}
-    resp = session.post(url, headers=headers, data=json.dumps(body))
-    if handle_rate(resp):
-        resp = session.post(url, headers=headers, data=json.dumps(body))
+    resp = send(session, "POST", url, headers=headers, data=json.dumps(body))
     resp.raise_for_status()
     pid = resp.json().get("id")
     print("[OK ] Created playlist: %s (%s)" % (name, pid))
@@ -223,7 +221,7 @@ def main():
         print("ERROR: Provide OAuth token with 'Bearer ' prefix via --token or SPOTIFY_OAUTH env.", file=sys.stderr)
         sys.exit(1)
 
-    session = requests.Session()
+    session = get_session()
     user_id = ensure_user_id(session, token, args.user or os.getenv("SPOTIFY_USER_ID"))
 
     public = True if args.public and not args.private else False
@@ -236,6 +234,8 @@ def main():
         process_csv(session, token, pid, csv_path, dry_run=args.dry_run)
 
     print("All done. Processed %d CSV files; created/reused %d playlists." % (len(args.csv), created_total))
+    print(http_stats())
+    print(get_limiter().summary())
 
 if __name__ == "__main__":
     main()
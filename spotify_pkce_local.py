@@ -2,9 +2,10 @@
 # 作用：本機起 127.0.0.1:8000/callback，啟動瀏覽器登入，換取 access_token 與 refresh_token
 # 會把 token 存到 tokens.json，並用 /v1/me/playlists 做一次測試呼叫
 
-import base64, hashlib, os, json, urllib.parse, webbrowser, requests
+import base64, hashlib, os, json, urllib.parse, webbrowser
 from http.server import BaseHTTPRequestHandler, HTTPServer
 from pathlib import Path
+from http_client import get_session
 
 # === 依你的設定 ===
 CLIENT_ID = "2536054109ef4aac89c6c6f3640a754b"
@@ -74,7 +75,7 @@ def main():
         "client_id": CLIENT_ID,
         "code_verifier": code_verifier,
     }
-    token_resp = requests.post(TOKEN_URL, data=data)
+    token_resp = get_session().post(TOKEN_URL, data=data)
     token_resp.raise_for_status()
     tokens = token_resp.json()
     print("Tokens:\n", json.dumps(tokens, indent=2))
@@ -83,7 +84,7 @@ def main():
     access_token = tokens["access_token"]
 
     # Step 4 測試呼叫
-    r = requests.get(
+    r = get_session().get(
         "https://api.spotify.com/v1/me/playlists",
         headers={"Authorization": f"Bearer {access_token}"},
         params={"limit": 5},
@@ -1,67 +1,151 @@
 # token_helper.py
-import json, time, requests
+import json, time, threading
 from pathlib import Path
+from http_client import get_session, http_stats
+from rate_limiter import get_limiter, retry_after_seconds
 
 CLIENT_ID = "2536054109ef4aac89c6c6f3640a754b"
 TOKEN_URL = "https://accounts.spotify.com/api/token"
 TOKENS_PATH = Path("tokens.json")
 
+# access_token 到期前幾秒就先刷新，避免請求途中過期
+REFRESH_SKEW_SEC = 60
+# tokens.json 沒有 expires_in 時的保守假設（Spotify 預設 3600 秒）
+DEFAULT_EXPIRES_IN = 3600
+
 def load_tokens():
     return json.loads(TOKENS_PATH.read_text(encoding="utf-8"))
 
 def save_tokens(tokens):
     TOKENS_PATH.write_text(json.dumps(tokens, indent=2), encoding="utf-8")
 
+class TokenManager:
+    """
+    記憶體內的 access_token 快取：
+      - 只在第一次使用時讀 tokens.json
+      - 依 expires_in / 取得時間推算到期時間，到期前 REFRESH_SKEW_SEC 秒主動刷新
+      - 不再每次呼叫前打 /v1/me 驗證；只有 API 回 401 時才強制刷新
+    stats 記錄省下的 /v1/me 探測與 refresh 次數，方便寫進執行日誌。
+    """
+
+    def __init__(self, path: Path = TOKENS_PATH, skew: float = REFRESH_SKEW_SEC):
+        self.path = path
+        self.skew = skew
+        self._lock = threading.Lock()
+        self._tokens = None
+        self._expires_at = 0.0
+        self.stats = {
+            "probes_saved": 0,      # 舊版每次都會打的 /v1/me
+            "refreshes": 0,         # 實際打到 TOKEN_URL 的次數
+            "refreshes_saved": 0,   # 多執行緒同時遇到 401 時合併掉的 refresh
+            "disk_reads": 0,
+        }
+
+    def _load(self):
+        tokens = json.loads(self.path.read_text(encoding="utf-8"))
+        self.stats["disk_reads"] += 1
+        expires_at = tokens.get("expires_at")
+        if expires_at is None:
+            # 舊格式沒有 expires_at：以檔案修改時間當作取得時間
+            issued_at = self.path.stat().st_mtime
+            expires_at = issued_at + float(tokens.get("expires_in", DEFAULT_EXPIRES_IN))
+        self._tokens = tokens
+        self._expires_at = float(expires_at)
+
+    def _refresh(self):
+        resp = get_session().post(
+            TOKEN_URL,
+            data={"grant_type": "refresh_token", "refresh_token": self._tokens["refresh_token"], "client_id": CLIENT_ID},
+            timeout=15,
+        )
+        resp.raise_for_status()
+        new_tokens = resp.json()
+        issued_at = time.time()
+        self._tokens["access_token"] = new_tokens["access_token"]
+        if "refresh_token" in new_tokens:
+            self._tokens["refresh_token"] = new_tokens["refresh_token"]
+        self._tokens["expires_in"] = int(new_tokens.get("expires_in", DEFAULT_EXPIRES_IN))
+        self._tokens["expires_at"] = issued_at + self._tokens["expires_in"]
+        self._expires_at = self._tokens["expires_at"]
+        self.stats["refreshes"] += 1
+        self.path.write_text(json.dumps(self._tokens, indent=2), encoding="utf-8")
+
+    def get_token(self) -> str:
+        with self._lock:
+            if self._tokens is None:
+                self._load()
+            if time.time() >= self._expires_at - self.skew:
+                self._refresh()
+            self.stats["probes_saved"] += 1
+            return self._tokens["access_token"]
+
+    def refresh(self) -> str:
+        """立即刷新並寫回 tokens.json（refresh_token.py 手動刷新用）"""
+        with self._lock:
+            if self._tokens is None:
+                self._load()
+            self._refresh()
+            return self._tokens["access_token"]
+
+    def invalidate(self, token: str) -> str:
+        """API 回 401 時呼叫；若別的執行緒已經換過 token 就直接沿用新的。"""
+        with self._lock:
+            if self._tokens is None:
+                self._load()
+            if self._tokens["access_token"] != token:
+                self.stats["refreshes_saved"] += 1
+            else:
+                self._refresh()
+            return self._tokens["access_token"]
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"token: 省下 /v1/me 探測 {s['probes_saved']} 次 | refresh {s['refreshes']} 次"
+                f"（合併 {s['refreshes_saved']} 次）| 讀取 tokens.json {s['disk_reads']} 次")
+
+_manager = TokenManager()
+
 def ensure_access_token():
-    tokens = load_tokens()
-    access = tokens["access_token"]
-    # 先打一個超輕量端點確認有效性
-    r = requests.get(
-        "https://api.spotify.com/v1/me",
-        headers={"Authorization": f"Bearer {access}"},
-        timeout=10,
-    )
-    if r.status_code != 401:
-        return access
-    # token 過期，進行 refresh
-    refresh = tokens["refresh_token"]
-    resp = requests.post(
-        TOKEN_URL,
-        data={"grant_type": "refresh_token", "refresh_token": refresh, "client_id": CLIENT_ID},
-        timeout=15,
-    )
-    resp.raise_for_status()
-    new_tokens = resp.json()
-    tokens["access_token"] = new_tokens["access_token"]
-    if "refresh_token" in new_tokens:
-        tokens["refresh_token"] = new_tokens["refresh_token"]
-    save_tokens(tokens)
-    return tokens["access_token"]
+    return _manager.get_token()
+
+def invalidate_access_token(token):
+    return _manager.invalidate(token)
+
+def token_stats() -> str:
+    return f"{_manager.summary()}\n{http_stats()}\n{get_limiter().summary()}"
 
 def _handle_rate_limit(resp):
+    """回報結果給共用的 rate limiter；429 時回傳 True 讓呼叫端重試（等待由 acquire 負責）"""
     if resp.status_code == 429:
-        wait = int(resp.headers.get("Retry-After", "1"))
-        time.sleep(wait + 1)
+        get_limiter().on_rate_limited(retry_after_seconds(resp))
         return True
+    get_limiter().on_success()
     return False
 
-def spotify_get(url, params=None, max_retry=3):
+def spotify_get(url, params=None, max_retry=3, headers=None):
+    """headers 可帶 If-None-Match；304 Not Modified 會直接回傳（body 為空）"""
     for i in range(max_retry):
         token = ensure_access_token()
-        resp = requests.get(url, headers={"Authorization": f"Bearer {token}"}, params=params, timeout=20)
+        get_limiter().acquire()
+        resp = get_session().get(url, headers={**(headers or {}), "Authorization": f"Bearer {token}"},
+                                 params=params, timeout=20)
         if _handle_rate_limit(resp):
             continue
         if resp.status_code == 401 and i < max_retry - 1:
-            time.sleep(0.5)
+            invalidate_access_token(token)
             continue
         resp.raise_for_status()
         return resp
     raise RuntimeError(f"GET {url} failed after retries")
 
-def spotify_post(url, json_body=None, params=None, max_retry=3):
+def _spotify_send_json(method, url, json_body=None, params=None, max_retry=3, acquired=False):
+    """acquired=True：呼叫端已先取得第一次請求的 rate limiter 額度（例如 batch_upload 依序取額度）"""
     for i in range(max_retry):
         token = ensure_access_token()
-        resp = requests.post(
+        if i > 0 or not acquired:
+            get_limiter().acquire()
+        resp = get_session().request(
+            method,
             url,
             headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"},
             json=json_body,
@@ -71,8 +155,17 @@ def spotify_post(url, json_body=None, params=None, max_retry=3):
         if _handle_rate_limit(resp):
             continue
         if resp.status_code == 401 and i < max_retry - 1:
-            time.sleep(0.5)
+            invalidate_access_token(token)
             continue
         resp.raise_for_status()
         return resp
-    raise RuntimeError(f"POST {url} failed after retries")
+    raise RuntimeError(f"{method} {url} failed after retries")
+
+def spotify_post(url, json_body=None, params=None, max_retry=3, acquired=False):
+    return _spotify_send_json("POST", url, json_body, params, max_retry, acquired)
+
+def spotify_delete(url, json_body=None, params=None, max_retry=3):
+    return _spotify_send_json("DELETE", url, json_body, params, max_retry)
+
+def spotify_put(url, json_body=None, params=None, max_retry=3):
+    return _spotify_send_json("PUT", url, json_body, params, max_retry)
@@ -0,0 +1,182 @@
+# track_matcher.py
+# 作用：兩個匯入工具共用的歌曲比對引擎(matching engine)
+# - 一次搜尋就取回 CANDIDATE_LIMIT 筆候選，在本機比對歌名/歌手/專輯相似度並打分數(confidence 0~1)
+# - 只有最佳分數低於 CONFIDENCE_THRESHOLD 時，才再送一次較寬鬆的搜尋
+# - 最佳分數仍低於 MIN_CONFIDENCE 視為找不到
+# - 結果存入 search_cache 的共用命名空間 CACHE_SCOPE，兩個工具的搜尋結果可以互相沿用
+# - 統計每首找到的歌平均花了幾次請求、confidence 分布，方便寫進執行日誌
+#
+# 傳輸方式由呼叫端決定：match() 接收 fetch(params) -> dict，match_async() 接收 async 版本，
+# 所以 token_helper、spotify_async 或自帶 session/token 的腳本都能用同一套比對邏輯。
+# fetch 遇到 401/403/5xx 等錯誤必須丟出例外，不能回傳空結果：空結果會被當成「找不到」寫進快取。
+import re
+import threading
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from search_cache import get_search_cache
+
+SEARCH_ENDPOINT = "https://api.spotify.com/v1/search"
+CANDIDATE_LIMIT = 20
+CONFIDENCE_THRESHOLD = 0.8   # 達到就不再送後續查詢
+MIN_CONFIDENCE = 0.45        # 低於此分數當作找不到
+CACHE_SCOPE = "match"        # search_cache 命名空間（所有使用本引擎的工具共用）
+
+WEIGHT_TITLE = 0.55
+WEIGHT_ARTIST = 0.35
+WEIGHT_ALBUM = 0.10
+
+# confidence 分布的區間（下限, 標籤）
+CONFIDENCE_BUCKETS = [(0.9, ">=0.90"), (0.8, "0.80-0.90"), (0.6, "0.60-0.80"), (MIN_CONFIDENCE, f"{MIN_CONFIDENCE:.2f}-0.60")]
+
+def norm(s: Optional[str]) -> str:
+    if s is None:
+        return ""
+    s = unicodedata.normalize("NFKC", s).lower().strip()
+    for ch in ['“', '”', '‘', '’', '–', '—', '‐', '‑', '‒']:
+        s = s.replace(ch, ' ')
+    s = re.sub(r"[^\w\s]", " ", s)
+    s = re.sub(r"\s+", " ", s).strip()
+    return s
+
+def similarity(a: str, b: str) -> float:
+    """已 norm 過的兩字串相似度；完全相同 1.0，一方包含另一方 0.9，其餘用 SequenceMatcher"""
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    if a in b or b in a:
+        return 0.9
+    return SequenceMatcher(None, a, b).ratio()
+
+class MatchResult(NamedTuple):
+    uri: Optional[str]
+    confidence: float  # 快取命中時為 1.0 / 0.0（不重新打分）
+    requests: int
+
+class TrackMatcher:
+    def __init__(self, market: Optional[str] = None, limit: int = CANDIDATE_LIMIT,
+                 threshold: float = CONFIDENCE_THRESHOLD, min_confidence: float = MIN_CONFIDENCE):
+        self.market = market
+        self.limit = limit
+        self.threshold = threshold
+        self.min_confidence = min_confidence
+        self._lock = threading.Lock()
+        self.stats = {"tracks": 0, "cached": 0, "resolved": 0, "requests": 0, "followups": 0}
+        self.histogram: Dict[str, int] = {label: 0 for _, label in CONFIDENCE_BUCKETS}
+        self.histogram["not found"] = 0
+
+    # ---- 查詢與打分 ----
+    def queries(self, title: str, artists: List[str], album: Optional[str]) -> List[str]:
+        """由嚴到寬：欄位篩選(field filter) → 歌名 + 歌手 → 只用歌名；專輯只用來打分"""
+        # 欄位值裡的雙引號會提早結束引號，先拿掉
+        q_title = " ".join(title.replace('"', " ").split())
+        main_artist = " ".join((artists[0] if artists else "").replace('"', " ").split())
+        if main_artist:
+            return [f'track:"{q_title}" artist:"{main_artist}"', f"{title} {main_artist}", title]
+        return [f'track:"{q_title}"', title]
+
+    def params(self, q: str) -> dict:
+        p = {"q": q, "type": "track", "limit": self.limit}
+        if self.market:
+            p["market"] = self.market
+        return p
+
+    def score(self, item: dict, title: str, artists: Iterable[str], album: Optional[str]) -> float:
+        it_title = norm(item.get("name", ""))
+        it_artists = [norm(a.get("name", "")) for a in (item.get("artists") or [])]
+        it_album = norm((item.get("album") or {}).get("name", ""))
+
+        t = similarity(norm(title), it_title)
+        targets = [norm(a) for a in artists if a]
+        if targets:
+            joined = " ".join(it_artists)
+            a = max(similarity(x, y) for x in targets for y in it_artists + [joined])
+            w_artist = WEIGHT_ARTIST
+        else:
+            a, w_artist = 0.0, 0.0
+        if album:
+            b, w_album = similarity(norm(album), it_album), WEIGHT_ALBUM
+        else:
+            b, w_album = 0.0, 0.0
+        return (WEIGHT_TITLE * t + w_artist * a + w_album * b) / (WEIGHT_TITLE + w_artist + w_album)
+
+    def best(self, data: dict, title: str, artists: List[str], album: Optional[str]):
+        items = (data or {}).get("tracks", {}).get("items", []) or []
+        best_uri, best_conf = None, 0.0
+        for it in items:
+            if not it or not it.get("uri"):
+                continue
+            conf = self.score(it, title, artists, album)
+            if conf > best_conf:
+                best_uri, best_conf = it["uri"], conf
+        return best_uri, best_conf
+
+    # ---- 主流程 ----
+    def _cached(self, title: str, artists: List[str], album: Optional[str]) -> Optional[MatchResult]:
+        cached, uri = get_search_cache().get(CACHE_SCOPE, title, ";".join(artists), album or "", self.market or "")
+        if not cached:
+            return None
+        with self._lock:
+            self.stats["cached"] += 1
+        return MatchResult(uri, 1.0 if uri else 0.0, 0)
+
+    def match(self, fetch: Callable[[dict], dict], title: str, artists: List[str],
+              album: Optional[str] = None) -> MatchResult:
+        """fetch(params) 送出一次 /v1/search 並回傳 JSON；先查 search_cache，命中就不送請求"""
+        hit = self._cached(title, artists, album)
+        if hit:
+            return hit
+        best_uri, best_conf, n = None, 0.0, 0
+        for q in self.queries(title, artists, album):
+            n += 1
+            uri, conf = self.best(fetch(self.params(q)), title, artists, album)
+            if conf > best_conf:
+                best_uri, best_conf = uri, conf
+            if best_conf >= self.threshold:
+                break
+        return self._finish(title, artists, album, best_uri, best_conf, n)
+
+    async def match_async(self, fetch: Callable[[dict], Awaitable[dict]], title: str, artists: List[str],
+                          album: Optional[str] = None) -> MatchResult:
+        hit = self._cached(title, artists, album)
+        if hit:
+            return hit
+        best_uri, best_conf, n = None, 0.0, 0
+        for q in self.queries(title, artists, album):
+            n += 1
+            uri, conf = self.best(await fetch(self.params(q)), title, artists, album)
+            if conf > best_conf:
+                best_uri, best_conf = uri, conf
+            if best_conf >= self.threshold:
+                break
+        return self._finish(title, artists, album, best_uri, best_conf, n)
+
+    def _finish(self, title: str, artists: List[str], album: Optional[str],
+                uri: Optional[str], conf: float, n: int) -> MatchResult:
+        if conf < self.min_confidence:
+            uri = None
+        get_search_cache().put(CACHE_SCOPE, title, ";".join(artists), album or "", self.market or "", uri)
+        with self._lock:
+            self.stats["tracks"] += 1
+            self.stats["requests"] += n
+            self.stats["followups"] += n - 1
+            if uri:
+                self.stats["resolved"] += 1
+                for low, label in CONFIDENCE_BUCKETS:
+                    if conf >= low:
+                        self.histogram[label] += 1
+                        break
+            else:
+                self.histogram["not found"] += 1
+        return MatchResult(uri, conf if uri else 0.0, n)
+
+    def summary(self) -> str:
+        with self._lock:
+            s = dict(self.stats)
+            hist = " ".join(f"{k}:{v}" for k, v in self.histogram.items())
+        per = s["requests"] / s["resolved"] if s["resolved"] else 0.0
+        return (f"match: 搜尋 {s['tracks']} 首（另有快取命中 {s['cached']}）| 找到 {s['resolved']}"
+                f" | 請求 {s['requests']}（後續查詢 {s['followups']}）| 每首找到的歌平均 {per:.2f} 次請求"
+                f" | confidence {hist}")
@@ -0,0 +1,118 @@
+# uri_check.py
+# 作用：匯入前先批次檢查 TrackURI 是否有效、在指定市場(market)能否播放
+# - 用 /v1/tracks?ids=...&market=...，一次 50 首
+# - Spotify 做過曲目重新連結(track relinking)時，改用回傳的可播放 URI（原 URI 在 linked_from）
+# - 結果存進 SQLite（uri_check.db），CHECK_TTL_DAYS 天內同一首不再查詢
+#
+# 用法：
+#   results = check_uris(uris, market="TW")
+#   results[uri].uri      → 要加入的 URI（重新連結後的），無效時為 None
+#   results[uri].status   → ok / relinked / invalid / not_found / unplayable
+import re
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from token_helper import spotify_get
+
+TRACKS_ENDPOINT = "https://api.spotify.com/v1/tracks"
+IDS_PER_CALL = 50
+CHECK_DB_PATH = Path("uri_check.db")
+CHECK_TTL_DAYS = 30
+
+DAY = 86400
+TRACK_URI_RE = re.compile(r"^spotify:track:([0-9A-Za-z]{22})$")
+
+class CheckResult(NamedTuple):
+    uri: Optional[str]   # 可加入的 URI；無效為 None
+    status: str          # ok / relinked / invalid / not_found / unplayable
+    reason: str = ""
+
+    @property
+    def usable(self) -> bool:
+        return self.uri is not None
+
+    def report_status(self, market: str) -> str:
+        """寫進 import_report 的說明"""
+        if self.status == "invalid":
+            return "Invalid URI"
+        if self.status == "not_found":
+            return "Track not found"
+        if self.status == "unplayable":
+            return f"Not playable in {market}" + (f" ({self.reason})" if self.reason else "")
+        return self.status
+
+class UriCheckCache:
+    def __init__(self, db_path: Path = CHECK_DB_PATH):
+        self.conn = sqlite3.connect(str(db_path), timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS checks ("
+            " uri TEXT, market TEXT, playable_uri TEXT, status TEXT, reason TEXT, checked REAL,"
+            " PRIMARY KEY (uri, market))"
+        )
+
+    def get_many(self, uris: List[str], market: str) -> Dict[str, CheckResult]:
+        out: Dict[str, CheckResult] = {}
+        cutoff = time.time() - CHECK_TTL_DAYS * DAY
+        for i in range(0, len(uris), 500):  # SQLite 參數數量上限
+            part = uris[i:i + 500]
+            marks = ",".join("?" * len(part))
+            rows = self.conn.execute(
+                f"SELECT uri, playable_uri, status, reason FROM checks"
+                f" WHERE market=? AND checked>=? AND uri IN ({marks})",
+                (market, cutoff, *part),
+            )
+            for uri, playable, status, reason in rows:
+                out[uri] = CheckResult(playable, status, reason or "")
+        return out
+
+    def put_many(self, results: Dict[str, CheckResult], market: str):
+        now = time.time()
+        self.conn.execute("BEGIN")
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO checks VALUES (?, ?, ?, ?, ?, ?)",
+            [(uri, market, r.uri, r.status, r.reason, now) for uri, r in results.items()],
+        )
+        self.conn.execute("COMMIT")
+
+def _classify(item: Optional[dict]) -> CheckResult:
+    if not item:
+        return CheckResult(None, "not_found")
+    if item.get("is_playable") is False:
+        reason = (item.get("restrictions") or {}).get("reason", "")
+        return CheckResult(None, "unplayable", reason)
+    if item.get("linked_from"):
+        return CheckResult(item["uri"], "relinked")
+    return CheckResult(item["uri"], "ok")
+
+def fetch_checks(uris: List[str], market: str) -> Dict[str, CheckResult]:
+    """實際呼叫 API；uris 須為格式正確的 spotify:track:<22 碼 ID>"""
+    out: Dict[str, CheckResult] = {}
+    for i in range(0, len(uris), IDS_PER_CALL):
+        part = uris[i:i + IDS_PER_CALL]
+        ids = [TRACK_URI_RE.match(u).group(1) for u in part]
+        data = spotify_get(TRACKS_ENDPOINT, params={"ids": ",".join(ids), "market": market}).json()
+        for uri, item in zip(part, data.get("tracks", [])):  # 回傳順序與 ids 相同，查無的為 null
+            out[uri] = _classify(item)
+    return out
+
+def check_uris(uris: Iterable[str], market: str, cache: Optional[UriCheckCache] = None) -> Dict[str, CheckResult]:
+    """回傳 {原 URI: CheckResult}；先查本機快取，只把沒查過（或過期）的送去 API"""
+    unique = list(dict.fromkeys(uris))
+    results: Dict[str, CheckResult] = {}
+    wellformed = []
+    for u in unique:
+        if TRACK_URI_RE.match(u):
+            wellformed.append(u)
+        else:
+            results[u] = CheckResult(None, "invalid")
+    cache = cache or UriCheckCache()
+    cached = cache.get_many(wellformed, market)
+    results.update(cached)
+    fresh = fetch_checks([u for u in wellformed if u not in cached], market)
+    if fresh:
+        cache.put_many(fresh, market)
+    results.update(fresh)
+    return results